@@ -0,0 +1,14 @@
+#!/bin/bash
+
+/Users/bjornpjo/Developer/apps/kromosynth-cli/analysis/commands/setup_analysis.py \
+    /Users/bjornpjo/QD/analysis/unsupervised/mapSwitch_analysisConfigs \
+    /Users/bjornpjo/QD/analysis/unsupervised/mapSwitch \
+    lineage,founder-innovation,phylogenetic-metrics \
+    --step-size 1 \
+    --data-path "lineage" \
+    --batch-operations \
+    --jobs 4 \
+    --skip-if-exists \
+#    --terrain-name ALL \
+
+# --terrain-name "customRef1" \
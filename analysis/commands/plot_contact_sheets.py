@@ -1,9 +1,12 @@
 import os
 import re
+import hashlib
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from pdf2image import convert_from_path
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase.pdfmetrics import stringWidth
 
@@ -25,34 +28,61 @@ def search_pdfs(root_dir):
                     types[plot_type][containing_folder].append(full_path)
     return types
 
-def create_thumbnails(pdfs, thumbnail_size):
-    thumbnails = []
-    for pdf in pdfs:
-        first_page = convert_from_path(pdf, first_page=1, last_page=1)[0]
-        aspect_ratio = first_page.width / first_page.height
-        if aspect_ratio > thumbnail_size[0] / thumbnail_size[1]:
-            scaled_width = thumbnail_size[0]
-            scaled_height = int(thumbnail_size[0] / aspect_ratio)
-        else:
-            scaled_height = thumbnail_size[1]
-            scaled_width = int(thumbnail_size[1] * aspect_ratio)
-
+THUMBNAIL_CACHE_DIRNAME = '.thumbnail_cache'
+
+def thumbnail_cache_path(cache_dir, pdf, thumbnail_size):
+    """Cache file for a PDF's thumbnail, keyed by its path, modification time and the thumbnail size."""
+    stat = os.stat(pdf)
+    key = f"{os.path.abspath(pdf)}|{stat.st_mtime_ns}|{thumbnail_size[0]}x{thumbnail_size[1]}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.png')
+
+def create_thumbnail(pdf, thumbnail_size, cache_dir=None):
+    cache_path = thumbnail_cache_path(cache_dir, pdf, thumbnail_size) if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        with Image.open(cache_path) as cached:
+            return cached.convert('RGB')
+
+    # Rasterize straight at thumbnail width rather than at full resolution;
+    # only pages taller than the thumbnail box need scaling down further
+    first_page = convert_from_path(pdf, first_page=1, last_page=1, size=(thumbnail_size[0], None))[0]
+    aspect_ratio = first_page.width / first_page.height
+    if aspect_ratio > thumbnail_size[0] / thumbnail_size[1]:
+        scaled_width = thumbnail_size[0]
+        scaled_height = int(thumbnail_size[0] / aspect_ratio)
+    else:
+        scaled_height = thumbnail_size[1]
+        scaled_width = int(thumbnail_size[1] * aspect_ratio)
+
+    thumbnail = first_page
+    if (scaled_width, scaled_height) != first_page.size:
         thumbnail = first_page.resize((scaled_width, scaled_height), Image.LANCZOS)
-        
-        # Create a new image with white background and adjusted bottom padding
-        full_thumb = Image.new('RGB', (thumbnail_size[0], thumbnail_size[1]), (255, 255, 255))
-        full_thumb.paste(thumbnail, ((thumbnail_size[0] - scaled_width) // 2,
-                                     (thumbnail_size[1] - scaled_height) // 2))
-        thumbnails.append(full_thumb)
-    return thumbnails
-
-def make_contact_sheet(files, output_name, thumbnail_size, margin, cols):
+    
+    # Create a new image with white background and adjusted bottom padding
+    full_thumb = Image.new('RGB', (thumbnail_size[0], thumbnail_size[1]), (255, 255, 255))
+    full_thumb.paste(thumbnail, ((thumbnail_size[0] - scaled_width) // 2,
+                                 (thumbnail_size[1] - scaled_height) // 2))
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + f'.{os.getpid()}.tmp'
+        full_thumb.save(tmp_path, format='PNG')
+        os.replace(tmp_path, cache_path)
+    return full_thumb
+
+def create_thumbnails(pdfs, thumbnail_size, cache_dir=None, workers=1):
+    """Thumbnails for pdfs, in order; rasterized by a pool of workers (pdftoppm runs as a subprocess)."""
+    if workers <= 1:
+        return [create_thumbnail(pdf, thumbnail_size, cache_dir) for pdf in pdfs]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda pdf: create_thumbnail(pdf, thumbnail_size, cache_dir), pdfs))
+
+def make_contact_sheet(files, output_name, thumbnail_size, margin, cols, cache_dir=None, workers=1):
     images = []
     labels = []
 
     # Collecting images and labels
     for label, pdf_files in files.items():
-        thumbnails = create_thumbnails(pdf_files, thumbnail_size)
+        thumbnails = create_thumbnails(pdf_files, thumbnail_size, cache_dir, workers)
         images.extend(thumbnails)
         labels.extend([label.replace('_', ' ')] * len(thumbnails))
 
@@ -88,6 +118,78 @@ def make_contact_sheet(files, output_name, thumbnail_size, margin, cols):
 
     c.save()
 
+def make_paginated_contact_sheet(files, output_name, thumbnail_size, margin, cols, rows_per_page,
+                                 cache_dir=None, workers=1, index_page=True):
+    """Write a contact sheet as fixed-size pages, rendering thumbnails one page at a time.
+
+    Only one page of thumbnails is held in memory.  Each experiment starts on a
+    new page headed by its label, with an outline entry, and an optional index
+    lists every experiment with a link to its first page.  Thumbnails are embedded
+    once each as compressed image XObjects rather than inline images.
+    """
+    experiments = [(label, pdf_files) for label, pdf_files in files.items() if pdf_files]
+    if not experiments:
+        return
+
+    header_height = 30
+    label_height = 30
+    line_height = 14
+    per_page = cols * rows_per_page
+    cell_height = thumbnail_size[1] + margin + label_height
+    page_width = cols * (thumbnail_size[0] + margin) + margin
+    page_height = rows_per_page * cell_height + margin + header_height
+
+    c = canvas.Canvas(output_name, pagesize=(page_width, page_height))
+
+    # Page numbers are known up front, as every experiment starts on a new page
+    index_lines_per_page = max(1, int((page_height - 2 * margin - header_height) // line_height))
+    index_pages = (len(experiments) + index_lines_per_page - 1) // index_lines_per_page if index_page else 0
+    first_pages = []
+    page_number = index_pages + 1
+    for _, pdf_files in experiments:
+        first_pages.append(page_number)
+        page_number += (len(pdf_files) + per_page - 1) // per_page
+
+    if index_page:
+        for index_start in range(0, len(experiments), index_lines_per_page):
+            c.drawString(margin, page_height - margin - 12, f"Index ({len(experiments)} experiments)")
+            y = page_height - margin - header_height
+            for exp_idx in range(index_start, min(index_start + index_lines_per_page, len(experiments))):
+                label = experiments[exp_idx][0].replace('_', ' ')
+                text = f"{label} ... page {first_pages[exp_idx]}"
+                c.drawString(margin, y, text)
+                c.linkRect('', f'experiment_{exp_idx}',
+                           (margin, y - 2, margin + stringWidth(text, c._fontname, c._fontsize), y + c._fontsize),
+                           relative=0)
+                y -= line_height
+            c.showPage()
+
+    for exp_idx, (label, pdf_files) in enumerate(experiments):
+        label = label.replace('_', ' ')
+        n_pages = (len(pdf_files) + per_page - 1) // per_page
+        for page_start in range(0, len(pdf_files), per_page):
+            page_pdfs = pdf_files[page_start:page_start + per_page]
+            thumbnails = create_thumbnails(page_pdfs, thumbnail_size, cache_dir, workers)
+
+            if page_start == 0:
+                c.bookmarkPage(f'experiment_{exp_idx}')
+                c.addOutlineEntry(label, f'experiment_{exp_idx}', level=0)
+            c.drawString(margin, page_height - margin - 12, f"{label} ({page_start // per_page + 1}/{n_pages})")
+
+            for i, (pdf, thumbnail) in enumerate(zip(page_pdfs, thumbnails)):
+                row, col = divmod(i, cols)
+                x = margin + col * (thumbnail_size[0] + margin)
+                y = page_height - header_height - (row + 1) * cell_height + label_height
+                c.drawImage(ImageReader(thumbnail), x, y, width=thumbnail_size[0], height=thumbnail_size[1])
+                wrapped_lines = wrap_label(os.path.basename(pdf), thumbnail_size[0], c._fontname, c._fontsize)
+                for j, line in enumerate(wrapped_lines[:2]):
+                    c.drawString(x, y - (j + 1) * 12, line)
+
+            c.showPage()
+            del thumbnails
+
+    c.save()
+
 def wrap_label(label, max_width, font_name, font_size):
     wrapped_lines = []
     words = label.split(' ')
@@ -103,22 +205,32 @@ def wrap_label(label, max_width, font_name, font_size):
         wrapped_lines.append(line.strip())
     return wrapped_lines
 
-def main(root_dir, output_dir):
+def main(root_dir, output_dir, workers=1, use_cache=True, rows_per_page=None, index_page=True):
     os.makedirs(output_dir, exist_ok=True)
     pdf_types = search_pdfs(root_dir)
+    cache_dir = os.path.join(output_dir, THUMBNAIL_CACHE_DIRNAME) if use_cache else None
 
     for plot_type, files in pdf_types.items():
         output_name = os.path.join(output_dir, f"{plot_type}_contact_sheet.pdf")
-        make_contact_sheet(files, output_name, (200, 300), 20, 4)
+        if rows_per_page:
+            make_paginated_contact_sheet(files, output_name, (200, 300), 20, 4, rows_per_page,
+                                         cache_dir, workers, index_page)
+        else:
+            make_contact_sheet(files, output_name, (200, 300), 20, 4, cache_dir, workers)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate contact sheets from PDF plots.")
     parser.add_argument("root_directory", help="The root directory containing the PDF plot files.")
     parser.add_argument("output_directory", help="The directory where the contact sheet PDFs will be saved.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of PDFs to rasterize in parallel (default: CPU count).")
+    parser.add_argument("--no-cache", action="store_true", help="Re-rasterize every PDF instead of reusing cached thumbnails.")
+    parser.add_argument("--rows-per-page", type=int, help="Write fixed-size pages with this many thumbnail rows, streaming one page at a time, instead of one tall page.")
+    parser.add_argument("--no-index", action="store_true", help="With --rows-per-page, leave out the index page of experiments.")
     
     args = parser.parse_args()
     
     # Usage example:
     # python plot_contact_sheets.py /path/to/root_directory /path/to/output_directory
     
-    main(args.root_directory, args.output_directory)
+    main(args.root_directory, args.output_directory, args.workers, not args.no_cache,
+         args.rows_per_page, not args.no_index)
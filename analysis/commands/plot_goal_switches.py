@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
-import json
+import os
+import sys
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 
+# plotUtil lives in the parent analysis directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import plotUtil
+
 def read_json_file(filepath, metric_name):
     """Read and extract relevant metrics from a JSON file."""
-    with open(filepath, 'r') as f:
-        data = json.load(f)
+    data = plotUtil.read_data_from_json(filepath)
     
     # Extract metrics
     metrics_container = data['evoRuns'][0]['aggregates'][metric_name]
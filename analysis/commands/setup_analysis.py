@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
 import os
+import sys
 import argparse
+import contextlib
+import fcntl
 import glob
+import hashlib
 import json
+import shlex
+import shutil
 import subprocess
+import tempfile
 import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
+# plot_server lives in the analysis directory, one level up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import plot_server as plot_server_client
+
 def create_directory_structure(base_path, analysis_type):
     """Create the directory structure for an experiment."""
     directories = {
@@ -90,16 +102,16 @@ def find_latest_lineage_file(base_analysis_path, step_size=None, terrain_name=No
     return newest_file
 
 def create_and_run_analysis_script(script_path, config_path, analysis_path, analysis_operation, step_size=None, terrain_name=None):
-    """Create and execute the analysis.sh script, returning the generated files."""
+    """Create and execute the analysis.sh script, returning the generated files (None if the command failed)."""
     # Base command for kromosynth
     base_cmd = f'kromosynth evo-runs-analysis --analysis-operations {analysis_operation} '
     base_cmd += f'--evolution-runs-config-json-file {config_path} '
     base_cmd += f'--write-to-folder {analysis_path}'
 
-    # Add lineage file if required
+    # Add lineage file if required (analysis_operation may be a comma-separated batch)
     lineage_ops = {"founder-innovation", "phylogenetic-metrics", "enhanced-phylogenetic-metrics", "lineage"}
-    if analysis_operation in lineage_ops:
-        # analysis_path is .../analysis/{analysis_operation}
+    if any(op in lineage_ops for op in analysis_operation.split(',')):
+        # analysis_path is .../analysis/{analysis_operation} (or .../analysis/_batch_<ops>)
         # lineage is in .../analysis/lineage
         base_analysis_path = os.path.dirname(analysis_path)  # .../analysis
         lineage_file = find_latest_lineage_file(base_analysis_path, step_size, terrain_name)
@@ -126,7 +138,7 @@ def create_and_run_analysis_script(script_path, config_path, analysis_path, anal
     except subprocess.CalledProcessError as e:
         print(f"Error executing command: {base_cmd}")
         print(f"Error: {e}")
-        return []
+        return None
     
     # Now clean old analysis files *after* new one is written
     clean_old_analysis_files(analysis_path)
@@ -174,8 +186,26 @@ def create_plot_command(plotting_script_path, analysis_file, plot_path, analysis
     # Default pattern if no match found
     return f'python3 {plotting_script_path} {analysis_file} 1 {plot_path_with_slash}'
 
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path + '.lock' while the block runs.
+
+    Concurrent jobs (--jobs N) for the same config share its script directory,
+    so every read-modify-write of analyse.sh, plot.sh and the plot manifest goes through this.
+    """
+    with open(path + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def append_unique_command(script_path, new_command):
     """Append a command to a script file only if it doesn't already exist."""
+    with file_lock(script_path):
+        return _append_unique_command(script_path, new_command)
+
+def _append_unique_command(script_path, new_command):
     existing_commands = set()
     
     # Read existing commands if file exists
@@ -215,6 +245,10 @@ def get_normalized_plot_command(plot_cmd):
 
 def append_unique_plot_command(script_path, new_command):
     """Append a plotting command to script file only if a similar command doesn't exist."""
+    with file_lock(script_path):
+        return _append_unique_plot_command(script_path, new_command)
+
+def _append_unique_plot_command(script_path, new_command):
     existing_commands = []
     normalized_new_command = get_normalized_plot_command(new_command)
     
@@ -248,10 +282,115 @@ def append_unique_plot_command(script_path, new_command):
     
     return True
 
-def create_plot_script(script_path, analysis_files, plot_path, plotting_script_path, analysis_operation, terrain_name, step_size=None, **kwargs):
-    """Create the plot.sh script using the actual generated analysis files."""
+PLOT_MANIFEST_FILENAME = 'plot_manifest.json'
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in chunks."""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def load_plot_manifest(manifest_path):
+    """Load the plot manifest, mapping normalized plot commands to the inputs they were last run with."""
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"Warning: Ignoring unreadable plot manifest {manifest_path}: {e}")
+        return {}
+
+def save_plot_manifest(manifest_path, manifest):
+    """Write the plot manifest atomically, through a temporary file unique to this writer."""
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(manifest_path) or '.',
+                                     prefix=os.path.basename(manifest_path) + '.', suffix='.tmp',
+                                     delete=False) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f.name, manifest_path)
+
+def update_plot_manifest(manifest_path, manifest_key, entry):
+    """Record one entry in the plot manifest, re-reading it under a lock so concurrent jobs' entries are kept."""
+    with file_lock(manifest_path):
+        manifest = load_plot_manifest(manifest_path)
+        manifest[manifest_key] = entry
+        save_plot_manifest(manifest_path, manifest)
+
+def analysis_file_fingerprint(analysis_file, previous_entry=None):
+    """Content hash of an analysis file, reusing the recorded hash when size and mtime are unchanged."""
+    stat = os.stat(analysis_file)
+    if (previous_entry and previous_entry.get('size') == stat.st_size
+            and previous_entry.get('mtime_ns') == stat.st_mtime_ns):
+        return previous_entry
+    return {
+        'sha256': file_content_hash(analysis_file),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+def snapshot_plot_outputs(plot_path):
+    """Modification times of the files under plot_path, by path."""
+    snapshot = {}
+    for root, _, files in os.walk(plot_path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            snapshot[file_path] = os.stat(file_path).st_mtime_ns
+    return snapshot
+
+def changed_plot_outputs(plot_path, before):
+    """Files under plot_path created or rewritten since the snapshot before was taken."""
+    return sorted(file_path for file_path, mtime_ns in snapshot_plot_outputs(plot_path).items()
+                  if before.get(file_path) != mtime_ns)
+
+def plot_outputs_current(entry):
+    """Whether a manifest entry's plot outputs all exist and are newer than the input they were plotted from.
+
+    Entries without recorded outputs (older manifests, or plots that wrote nothing) are never current.
+    """
+    outputs = entry.get('outputs')
+    if not outputs:
+        return False
+    input_mtime_ns = entry.get('input', {}).get('mtime_ns', 0)
+    for output in outputs:
+        if not os.path.exists(output) or os.stat(output).st_mtime_ns < input_mtime_ns:
+            return False
+    return True
+
+def run_plot_command(plot_cmd, plot_server_socket=None):
+    """Run a plotting command, as a job on the plot server if one is listening on plot_server_socket.
+
+    Raises subprocess.CalledProcessError if the command fails, either way.
+    """
+    if plot_server_socket and plot_server_client.is_server_running(plot_server_socket):
+        command = shlex.split(plot_cmd)
+        if os.path.basename(command[0]).startswith('python'):
+            response = plot_server_client.submit_job({'script': command[1], 'args': command[2:]}, plot_server_socket)
+            print(response['output'], end='')
+            if response['returncode'] != 0:
+                raise subprocess.CalledProcessError(response['returncode'], plot_cmd)
+            return
+    elif plot_server_socket:
+        print(f"Plot server not running on {plot_server_socket}, starting a new process")
+    subprocess.run(plot_cmd, shell=True, check=True)
+
+def create_plot_script(script_path, analysis_files, plot_path, plotting_script_path, analysis_operation, terrain_name, step_size=None, force_replot=False, plot_server=None, **kwargs):
+    """Create the plot.sh script using the actual generated analysis files.
+
+    Plots are only regenerated when the content of their analysis file or the
+    plot arguments changed since the last successful run, as recorded in
+    plot_manifest.json next to the script, or when one of the output files
+    that run wrote is missing or older than its input (unless force_replot is set).
+    If plot_server is a socket path, commands are sent to the plot server.
+    Returns the plotting commands that failed.
+    """
+    failed_commands = []
     # Sort files to ensure consistent ordering
     analysis_files = sorted(analysis_files)
+
+    manifest_path = os.path.join(os.path.dirname(script_path), PLOT_MANIFEST_FILENAME)
+    manifest = load_plot_manifest(manifest_path)
     
     # Create plotting commands for each analysis file
     for analysis_file in analysis_files:
@@ -266,14 +405,36 @@ def create_plot_script(script_path, analysis_files, plot_path, plotting_script_p
         )
         # Add command to script if it's unique (ignoring timestamps)
         append_unique_plot_command(script_path, plot_cmd)
+
+        # The normalized command identifies the plot independently of the analysis file's timestamp,
+        # while still capturing the plotting script and all of its arguments
+        manifest_key = get_normalized_plot_command(plot_cmd)
+        previous = manifest.get(manifest_key, {})
+        fingerprint = analysis_file_fingerprint(analysis_file, previous.get('input'))
+        if not force_replot and previous.get('input', {}).get('sha256') == fingerprint['sha256']:
+            if plot_outputs_current(previous):
+                print(f"Skipping plotting command, analysis file unchanged: {plot_cmd}")
+                continue
+            print(f"Plot outputs missing or older than the analysis file, re-plotting: {plot_cmd}")
         
-        # Execute the plotting command
+        # Execute the plotting command, noting which files under plot_path it writes
         print(f"Executing plotting command: {plot_cmd}")
+        outputs_before = snapshot_plot_outputs(plot_path)
         try:
-            subprocess.run(plot_cmd, shell=True, check=True)
+            run_plot_command(plot_cmd, plot_server)
         except subprocess.CalledProcessError as e:
             print(f"Error executing command: {plot_cmd}")
             print(f"Error: {e}")
+            failed_commands.append(plot_cmd)
+            continue
+
+        update_plot_manifest(manifest_path, manifest_key, {
+            'command': plot_cmd,
+            'input': fingerprint,
+            'outputs': changed_plot_outputs(plot_path, outputs_before),
+            'plotted_at': datetime.now().isoformat()
+        })
+    return failed_commands
 
 def has_existing_analysis(analysis_path, analysis_operation, step_size=None, terrain_name=None):
     """Check if there's an existing analysis file of the same type."""
@@ -318,9 +479,26 @@ def has_existing_analysis(analysis_path, analysis_operation, step_size=None, ter
     print("No matching analysis file found")
     return False
 
+def copy_config_file(config_file, config_dir):
+    """Copy a config file into config_dir, replacing any existing copy atomically.
+
+    Concurrent jobs for the same config all copy it, while another job's
+    kromosynth may be reading the copy, so it is never truncated in place.
+    """
+    config_dest = os.path.join(config_dir, os.path.basename(config_file))
+    with tempfile.NamedTemporaryFile('wb', dir=config_dir, prefix=os.path.basename(config_file) + '.',
+                                     suffix='.tmp', delete=False) as dst, open(config_file, 'rb') as src:
+        shutil.copyfileobj(src, dst)
+    os.replace(dst.name, config_dest)
+    return config_dest
+
 def setup_experiment_structure(config_file, base_output_path, analysis_operation, plotting_script_path=None, 
-                             step_size=None, terrain_name=None, skip_analysis=False, skip_if_exists=False, **kwargs):
-    """Set up the complete experiment structure for a single config file."""
+                             step_size=None, terrain_name=None, skip_analysis=False, skip_if_exists=False,
+                             force_replot=False, **kwargs):
+    """Set up the complete experiment structure for a single config file.
+
+    Returns (analysis_succeeded, plots_succeeded).
+    """
     # Extract experiment name from config file
     experiment_name = os.path.splitext(os.path.basename(config_file))[0]
     
@@ -333,12 +511,10 @@ def setup_experiment_structure(config_file, base_output_path, analysis_operation
     # Check if we should skip this config due to existing analysis
     if skip_if_exists and has_existing_analysis(directories['analysis'], analysis_operation, step_size, terrain_name):
         print(f"Skipping {experiment_name} - analysis already exists")
-        return
+        return True, True
     
     # Copy config file to config directory
-    config_dest = os.path.join(directories['config'], os.path.basename(config_file))
-    with open(config_file, 'r') as src, open(config_dest, 'w') as dst:
-        dst.write(src.read())
+    config_dest = copy_config_file(config_file, directories['config'])
     
     generated_files = []
     if not skip_analysis:
@@ -352,6 +528,8 @@ def setup_experiment_structure(config_file, base_output_path, analysis_operation
             step_size,
             terrain_name
         )
+        if generated_files is None:
+            return False, False
     else:
         # If skipping analysis, just get the newest existing analysis files
         analysis_path = directories['analysis']
@@ -365,7 +543,7 @@ def setup_experiment_structure(config_file, base_output_path, analysis_operation
     # Create and run plot script only if plotting_script_path is provided and we have files to plot
     if plotting_script_path and generated_files:
         plot_script_path = os.path.join(directories['script'], 'plot.sh')
-        create_plot_script(
+        failed_commands = create_plot_script(
             plot_script_path,
             generated_files,
             directories['plot'],
@@ -373,14 +551,289 @@ def setup_experiment_structure(config_file, base_output_path, analysis_operation
             analysis_operation,
             terrain_name,
             step_size,
+            force_replot,
             **kwargs
         )
+        if failed_commands:
+            return True, False
+    return True, True
+
+BATCH_STAGING_DIRECTORY = '_batch'
+ANALYSIS_FILE_PREFIX = 'evolution-run-analysis_'
+
+def fan_out_batch_analysis_file(batch_file, batch_operations, analysis_paths):
+    """Link a batched analysis file into each operation's analysis directory.
+
+    The CLI names a batched result evolution-run-analysis_<op1>,<op2>,..._<rest>.json;
+    each operation gets evolution-run-analysis_<op>_<rest>.json, so the per-operation
+    tooling (has_existing_analysis, clean_old_analysis_files, plotting) is unchanged.
+    Hard links are used where possible, so the file's content is stored once.
+    Returns a dict from operation to its file.
+    """
+    batch_name = os.path.basename(batch_file)
+    batch_prefix = ANALYSIS_FILE_PREFIX + ','.join(batch_operations)
+    if not batch_name.startswith(batch_prefix):
+        raise ValueError(f"Batched analysis file {batch_file} is not named {batch_prefix}_..., "
+                         f"so it is not the result of the {','.join(batch_operations)} batch")
+    suffix = batch_name[len(batch_prefix):]
+    operation_files = {}
+    for analysis_operation in batch_operations:
+        operation_file = os.path.join(analysis_paths[analysis_operation], ANALYSIS_FILE_PREFIX + analysis_operation + suffix)
+        if os.path.exists(operation_file):
+            os.remove(operation_file)
+        try:
+            os.link(batch_file, operation_file)
+        except OSError:
+            shutil.copy2(batch_file, operation_file)
+        print(f"Fanned out {batch_name} to {operation_file}")
+        clean_old_analysis_files(analysis_paths[analysis_operation])
+        operation_files[analysis_operation] = operation_file
+    os.remove(batch_file)
+    return operation_files
+
+def setup_experiment_batch(config_file, base_output_path, analysis_operations, plotting_script_path=None,
+                           step_size=None, terrain_name=None, skip_analysis=False, skip_if_exists=False,
+                           force_replot=False, **kwargs):
+    """Set up several analysis operations for one config file with a single kromosynth invocation.
+
+    The combined analysis file is written to analysis/_batch_<op1>+<op2>..., a staging
+    directory of its own so concurrent batches for the same config cannot pick up each
+    other's results, and then fanned out to analysis/<op> for each operation, followed
+    by per-operation plotting into plot/<op>.
+    Returns (analysis_succeeded, plots_succeeded).
+    """
+    experiment_name = os.path.splitext(os.path.basename(config_file))[0]
+    experiment_path = os.path.join(base_output_path, experiment_name)
+    directories_by_op = {op: create_directory_structure(experiment_path, op) for op in analysis_operations}
+    directories = directories_by_op[analysis_operations[0]]
+
+    if skip_if_exists:
+        remaining_operations = []
+        for analysis_operation in analysis_operations:
+            if has_existing_analysis(directories_by_op[analysis_operation]['analysis'], analysis_operation, step_size, terrain_name):
+                print(f"Skipping {analysis_operation} for {experiment_name} - analysis already exists")
+            else:
+                remaining_operations.append(analysis_operation)
+        analysis_operations = remaining_operations
+        if not analysis_operations:
+            return True, True
+
+    config_dest = copy_config_file(config_file, directories['config'])
+
+    generated_files = {}
+    if not skip_analysis:
+        # A sibling of analysis/lineage, where create_and_run_analysis_script looks for the lineage file
+        staging_path = os.path.join(experiment_path, 'analysis',
+                                    BATCH_STAGING_DIRECTORY + '_' + '+'.join(analysis_operations))
+        os.makedirs(staging_path, exist_ok=True)
+        batch_files = create_and_run_analysis_script(
+            os.path.join(directories['script'], 'analyse.sh'),
+            config_dest,
+            staging_path,
+            ','.join(analysis_operations),
+            step_size,
+            terrain_name
+        )
+        if batch_files is None:
+            return False, False
+        if batch_files:
+            analysis_paths = {op: directories_by_op[op]['analysis'] for op in analysis_operations}
+            generated_files = fan_out_batch_analysis_file(batch_files[0], analysis_operations, analysis_paths)
+    else:
+        for analysis_operation in analysis_operations:
+            analysis_files = glob.glob(os.path.join(directories_by_op[analysis_operation]['analysis'], '*.json'))
+            if analysis_files:
+                generated_files[analysis_operation] = sorted(analysis_files,
+                                   key=lambda x: int(os.path.basename(x).split('_')[-1].split('.')[0]))[-1]
+
+    plots_succeeded = True
+    if plotting_script_path:
+        for analysis_operation, analysis_file in generated_files.items():
+            failed_commands = create_plot_script(
+                os.path.join(directories_by_op[analysis_operation]['script'], 'plot.sh'),
+                [analysis_file],
+                directories_by_op[analysis_operation]['plot'],
+                plotting_script_path,
+                analysis_operation,
+                terrain_name,
+                step_size,
+                force_replot,
+                **kwargs
+            )
+            if failed_commands:
+                plots_succeeded = False
+    return True, plots_succeeded
+
+# Operations that are passed the newest lineage analysis file (see find_latest_lineage_file),
+# so for the same config they have to wait until a requested lineage analysis has completed
+LINEAGE_DEPENDENT_OPERATIONS = {"founder-innovation", "phylogenetic-metrics", "enhanced-phylogenetic-metrics"}
+
+def parse_analysis_operations(analysis_operations):
+    """Split comma-separated operations, ordering lineage first so dependent operations can follow it."""
+    operations = [op.strip() for op in analysis_operations.split(',') if op.strip()]
+    return sorted(operations, key=lambda op: op != 'lineage')
+
+def group_analysis_operations(analysis_operations, batch=False):
+    """Group operations into the units run by one kromosynth invocation each.
+
+    Unbatched, every operation is its own group. Batched, lineage-dependent operations
+    form a second group after all the others, as they need the lineage file the first
+    group produces. Groups are returned as comma-separated strings.
+    """
+    if not batch:
+        return list(analysis_operations)
+    independent = [op for op in analysis_operations if op not in LINEAGE_DEPENDENT_OPERATIONS]
+    dependent = [op for op in analysis_operations if op in LINEAGE_DEPENDENT_OPERATIONS]
+    return [','.join(group) for group in (independent, dependent) if group]
+
+def build_analysis_jobs(config_files, analysis_operations, batch=False):
+    """One job per (config file, operation group), with dependencies on that config's lineage job."""
+    jobs = []
+    groups = group_analysis_operations(analysis_operations, batch)
+    lineage_group = next((group for group in groups if 'lineage' in group.split(',')), None)
+    for config_file in config_files:
+        for analysis_operation in groups:
+            depends_on = []
+            if lineage_group and any(op in LINEAGE_DEPENDENT_OPERATIONS for op in analysis_operation.split(',')):
+                depends_on.append((config_file, lineage_group))
+            jobs.append({
+                'id': (config_file, analysis_operation),
+                'config_file': config_file,
+                'analysis_operation': analysis_operation,
+                'depends_on': depends_on
+            })
+    return jobs
+
+def job_log_path(job, base_output_path):
+    """Log file for a job, in the experiment's script directory."""
+    experiment_name = os.path.splitext(os.path.basename(job['config_file']))[0]
+    script_dir = os.path.join(base_output_path, experiment_name, 'script')
+    os.makedirs(script_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    operations_name = job['analysis_operation'].replace(',', '+')
+    return os.path.join(script_dir, f"setup_{operations_name}_{timestamp}.log")
+
+def run_analysis_job(job, setup_args, log_path=None):
+    """Run setup_experiment_structure for one job, sending its output (including subprocesses') to log_path.
+
+    Returns (analysis_succeeded, plots_succeeded).
+    """
+    analysis_operations = job['analysis_operation'].split(',')
+    def run():
+        setup = setup_experiment_batch if len(analysis_operations) > 1 else setup_experiment_structure
+        return setup(
+            job['config_file'],
+            setup_args['base_output_path'],
+            analysis_operations if len(analysis_operations) > 1 else analysis_operations[0],
+            setup_args['plotting_script_path'],
+            setup_args['step_size'],
+            setup_args['terrain_name'],
+            setup_args['skip_analysis'],
+            setup_args['skip_if_exists'],
+            setup_args['force_replot'],
+            **setup_args['kwargs']
+        )
+    if log_path is None:
+        return run()
+
+    # Redirect the file descriptors rather than sys.stdout, so that the output of
+    # the kromosynth and plotting subprocesses is captured as well
+    with open(log_path, 'w') as log:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            return run()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_stdout, 1)
+            os.dup2(saved_stderr, 2)
+            os.close(saved_stdout)
+            os.close(saved_stderr)
+
+def job_result(analysis_succeeded, plots_succeeded, log_path):
+    status = 'succeeded' if analysis_succeeded and plots_succeeded else 'failed'
+    return status, log_path, analysis_succeeded
+
+def run_analysis_jobs(jobs, setup_args, max_workers=1):
+    """Run jobs, up to max_workers at a time in separate processes, respecting their dependencies.
+
+    With a single worker, jobs run in order in this process and print to the console.
+    Returns a dict from job id to (status, log_path, analysis_succeeded), where status
+    is 'succeeded', 'failed' (the analysis or a plot failed) or 'skipped' (the analysis
+    of a dependency did not succeed).  Dependent jobs only need their dependencies'
+    analysis files, so a failed plot does not hold them back.
+    """
+    results = {}
+    if max_workers <= 1:
+        for job in jobs:
+            if any(not results.get(dep, ('failed', None, False))[2] for dep in job['depends_on']):
+                results[job['id']] = ('skipped', None, False)
+                continue
+            print(f"\nProcessing {job['config_file']} ({job['analysis_operation']})...")
+            try:
+                analysis_succeeded, plots_succeeded = run_analysis_job(job, setup_args)
+            except Exception as e:
+                print(f"Error processing {job['config_file']} ({job['analysis_operation']}): {e}")
+                analysis_succeeded = plots_succeeded = False
+            results[job['id']] = job_result(analysis_succeeded, plots_succeeded, None)
+            if results[job['id']][0] == 'succeeded':
+                print(f"Completed setup for {job['config_file']} ({job['analysis_operation']})")
+            else:
+                print(f"Setup failed for {job['config_file']} ({job['analysis_operation']})")
+        return results
+
+    pending = list(jobs)
+    running = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # Submit every pending job whose dependencies have all finished
+            for job in list(pending):
+                dep_analyses = [results[dep][2] for dep in job['depends_on'] if dep in results]
+                if len(dep_analyses) < len(job['depends_on']):
+                    continue
+                pending.remove(job)
+                if not all(dep_analyses):
+                    results[job['id']] = ('skipped', None, False)
+                    print(f"Skipping {job['config_file']} ({job['analysis_operation']}) - the analysis of a dependency did not succeed")
+                    continue
+                log_path = job_log_path(job, setup_args['base_output_path'])
+                print(f"Started {job['config_file']} ({job['analysis_operation']}), logging to {log_path}")
+                running[executor.submit(run_analysis_job, job, setup_args, log_path)] = (job, log_path)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, log_path = running.pop(future)
+                try:
+                    analysis_succeeded, plots_succeeded = future.result()
+                except Exception as e:
+                    print(f"Error processing {job['config_file']} ({job['analysis_operation']}): {e}")
+                    analysis_succeeded = plots_succeeded = False
+                results[job['id']] = job_result(analysis_succeeded, plots_succeeded, log_path)
+                print(f"Finished {job['config_file']} ({job['analysis_operation']}): {results[job['id']][0]}")
+    return results
+
+def print_job_summary(jobs, results):
+    print("\nSummary:")
+    for status in ('succeeded', 'failed', 'skipped'):
+        matching = [job for job in jobs if results[job['id']][0] == status]
+        print(f"  {status}: {len(matching)}")
+        if status == 'succeeded':
+            continue
+        for job in matching:
+            _, log_path, analysis_succeeded = results[job['id']]
+            plotting_only = " (plotting failed)" if status == 'failed' and analysis_succeeded else ""
+            print(f"    {job['config_file']} ({job['analysis_operation']}){plotting_only}" + (f" - log: {log_path}" if log_path else ""))
 
 def main():
     parser = argparse.ArgumentParser(description='Setup experiment analysis structure')
     parser.add_argument('config_dir', help='Directory containing experiment config files')
     parser.add_argument('base_output_path', help='Base path for output directories')
-    parser.add_argument('analysis_operation', help='Analysis operation to perform (e.g., score-matrix, score-matrices, qd-scores)')
+    parser.add_argument('analysis_operation', help='Analysis operation(s) to perform, comma-separated (e.g., score-matrix, score-matrices, qd-scores, lineage,founder-innovation)')
     parser.add_argument('--data-path', required=True, help='Path to the data directory')
     parser.add_argument('--plotting-script', help='Path to the plotting script (optional)', dest='plotting_script_path')
     parser.add_argument('--step-size', type=int, help='Step size for analysis (optional)')
@@ -391,6 +844,14 @@ def main():
     parser.add_argument('--ylabel', help='Label for the y-axis in plots (optional)')
     parser.add_argument('--skip-if-exists', action='store_true', 
                        help='Skip analysis and plotting if results already exist for this configuration')
+    parser.add_argument('--force-replot', action='store_true',
+                       help='Re-run every plotting command, even if its analysis file and arguments are unchanged')
+    parser.add_argument('--jobs', type=int, default=1,
+                       help='Number of config/operation jobs to run concurrently, each logging to its script directory (default: 1)')
+    parser.add_argument('--plot-server', nargs='?', const=plot_server_client.DEFAULT_SOCKET_PATH,
+                       help='Send plotting commands to a running plot_server.py on this Unix socket instead of starting a process for each (optional)')
+    parser.add_argument('--batch-operations', action='store_true',
+                       help='Run all requested operations for a config in one kromosynth invocation (lineage-dependent operations in a second one) and fan the result out to analysis/<op> and plot/<op>')
     
     args = parser.parse_args()
     
@@ -401,7 +862,7 @@ def main():
     kwargs = vars(args).copy()
     # Remove non-kwargs arguments
     for arg in ['config_dir', 'base_output_path', 'analysis_operation', 'plotting_script_path', 
-               'step_size', 'terrain_name', 'skip_analysis', 'skip_if_exists']:
+               'step_size', 'terrain_name', 'skip_analysis', 'skip_if_exists', 'force_replot', 'jobs', 'batch_operations']:
         kwargs.pop(arg, None)
     
     # Find all .jsonc files in the config directory
@@ -411,21 +872,19 @@ def main():
         print(f"No .jsonc files found in {args.config_dir}")
         return
     
-    # Process each config file
-    for config_file in config_files:
-        print(f"\nProcessing {config_file}...")
-        setup_experiment_structure(
-            config_file,
-            args.base_output_path,
-            args.analysis_operation,
-            args.plotting_script_path,
-            args.step_size,
-            args.terrain_name,
-            args.skip_analysis,
-            args.skip_if_exists,
-            **kwargs
-        )
-        print(f"Completed setup for {config_file}")
+    setup_args = {
+        'base_output_path': args.base_output_path,
+        'plotting_script_path': args.plotting_script_path,
+        'step_size': args.step_size,
+        'terrain_name': args.terrain_name,
+        'skip_analysis': args.skip_analysis,
+        'skip_if_exists': args.skip_if_exists,
+        'force_replot': args.force_replot,
+        'kwargs': kwargs
+    }
+    jobs = build_analysis_jobs(sorted(config_files), parse_analysis_operations(args.analysis_operation), args.batch_operations)
+    results = run_analysis_jobs(jobs, setup_args, args.jobs)
+    print_job_summary(jobs, results)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -20,7 +20,7 @@ if len(sys.argv) > 4:
 else:
     terrain = "customRef1"
 
-data = plotUtil.read_data_from_json(json_file_path)
+evoRuns = plotUtil.read_aggregate_series(json_file_path, 'coverage', terrain)
 
 legend_lookup = {
     'one_comb-dur_0.5': 'SIE',
@@ -48,7 +48,7 @@ plt.figure(figsize=(4*cm, 3*cm))
 maxIterations = 48  # divided by x_multiplier
 print("maxIterations:" + str(maxIterations) + " (divided by x_multiplier)")
 legend_lines = []
-for oneEvorun in data['evoRuns']:
+for oneEvorun in evoRuns:
     # add oneEvorun to legend_lookup if not already present
     if oneEvorun['label'] not in legend_lookup:
         parts = oneEvorun['label'].split('_')
@@ -58,9 +58,8 @@ for oneEvorun in data['evoRuns']:
             shortened_label = oneEvorun['label']
         legend_lookup[oneEvorun['label']] = shortened_label
 
-    coverage = oneEvorun['aggregates']['coverage'][terrain]
-    coverageMeans = np.array(coverage['means'])[:maxIterations]
-    coverageStdDevs = np.array(coverage['stdDevs'])[:maxIterations]
+    coverageMeans = oneEvorun['means'][:maxIterations]
+    coverageStdDevs = oneEvorun['stdDevs'][:maxIterations]
 
     print(len(coverageMeans))
 
@@ -76,7 +75,7 @@ for oneEvorun in data['evoRuns']:
 
     legend_lines.append((line, fill))
 
-plt.legend(legend_lines, [legend_lookup[oneEvorun['label']] for oneEvorun in data['evoRuns']])
+plt.legend(legend_lines, [legend_lookup[oneEvorun['label']] for oneEvorun in evoRuns])
 
 x_max = maxIterations * x_multiplier
 desired_ticks = np.linspace(0, x_max, 3)  # Creates 3 evenly spaced ticks
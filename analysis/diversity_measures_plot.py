@@ -1,14 +1,10 @@
 import sys
-import json
+import plotUtil
 import numpy as np
 import matplotlib.pyplot as plt
 from cycler import cycler
 from palettable.colorbrewer.qualitative import Set1_3
 
-def read_data_from_json(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
 def create_shortened_label(label):
     """Create a shortened version of the label, focusing on the most distinctive parts."""
     parts = label.split('_')
@@ -37,7 +33,7 @@ def main():
     legend_placement = sys.argv[5] if len(sys.argv) > 5 else 'inside'
 
     # Read data
-    data = read_data_from_json(json_file_path)
+    data = plotUtil.read_data_from_json(json_file_path)
     
     # Plot settings
     colors = Set1_3.mpl_colors
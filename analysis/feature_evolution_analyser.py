@@ -1,50 +1,148 @@
 import json
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
-import networkx as nx
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
+from scipy import sparse
 from pathlib import Path
 
+# seaborn, networkx, plotly and pandas are slow to import and only needed by some
+# of the plots, so each plot method imports what it uses
+
 # for analyzing the evolution of dynamic feature-index sets (which were selected based on their information/variance contribution)
 
 class FeatureEvolutionAnalyzer:
-    def __init__(self, json_path):
+    def __init__(self, json_path, stream=False):
+        # With stream=True the log is parsed incrementally with ijson, one generation
+        # at a time, so the raw document is never held in memory as a whole; it is
+        # parsed twice, once to size the arrays and once to fill them
+        if stream:
+            self.process_data(lambda: self.stream_generations(json_path))
+        else:
+            data = self.load_generations(json_path)
+            self.process_data(lambda: iter(data.items()))
+
+    @staticmethod
+    def load_generations(json_path):
         with open(json_path) as f:
-            self.data = json.load(f)["0"]
-        self.process_data()
+            return json.load(f)["0"]
 
-    def process_data(self):
-        self.generations = []
-        self.feature_counts = []
-        self.avg_contributions = []
-        self.contribution_spreads = []
-        self.feature_matrix = []
-        
-        self.max_feature_index = max(
-            max(gen_data['feature_indices'])
-            for gen, gen_data in self.data.items()
-            if gen != 'eliteMapIndex'
-        )
-        
-        for gen, gen_data in sorted(self.data.items(), key=lambda x: int(x[0])):
+    @staticmethod
+    def stream_generations(json_path):
+        import ijson
+        with open(json_path, 'rb') as f:
+            yield from ijson.kvitems(f, '0', use_float=True)
+
+    def process_data(self, generation_items):
+        """Build the per-generation metrics and sparse matrices from a log's generations.
+
+        generation_items is called once per pass and returns an iterable of
+        (generation key, generation data) pairs in any order.  The first pass
+        sizes the arrays, which the second fills in place, generation by generation.
+        """
+        # First pass: the number of selected features of each generation
+        gen_nums = []
+        selection_sizes = []
+        for gen, gen_data in generation_items():
             if gen == 'eliteMapIndex':
                 continue
-                
-            gen_num = int(gen)
-            indices = gen_data['feature_indices']
-            contributions = [gen_data['feature_contribution'][i] for i in indices]
-            
-            self.generations.append(gen_num)
-            self.feature_counts.append(len(indices))
-            self.avg_contributions.append(np.mean(contributions))
-            self.contribution_spreads.append(np.max(contributions) - np.min(contributions))
-            
-            selected = np.zeros(self.max_feature_index + 1)
-            selected[indices] = contributions  # Store contribution values instead of binary
-            self.feature_matrix.append(selected)
+            gen_nums.append(int(gen))
+            selection_sizes.append(len(gen_data['feature_indices']))
+        order = np.argsort(gen_nums, kind='stable')
+        self.generations = [gen_nums[i] for i in order]
+        self._row_of_generation = {gen_num: row for row, gen_num in enumerate(self.generations)}
+
+        # Rows are in generation order; the selections concatenated into preallocated
+        # arrays, in each generation's original order, double as the CSR arrays of
+        # the generations x features matrices
+        nnz = sum(selection_sizes)
+        index_dtype = np.int32 if nnz < 2**31 else np.int64
+        self.selection_indptr = np.zeros(len(gen_nums) + 1, dtype=index_dtype)
+        self.selection_indptr[1:] = np.cumsum(np.asarray(selection_sizes, dtype=np.int64)[order])
+        self.selected_features = np.empty(nnz, dtype=index_dtype)
+        self.selected_contributions = np.empty(nnz, dtype=np.float32)
+        feature_counts = np.zeros(len(gen_nums), dtype=np.int64)
+        avg_contributions = np.zeros(len(gen_nums), dtype=np.float64)
+        contribution_spreads = np.zeros(len(gen_nums), dtype=np.float64)
+        max_feature_index = -1
+
+        # Second pass: reduce each generation to its selected feature indices and
+        # their contributions, written straight into its row
+        for gen, gen_data in generation_items():
+            if gen == 'eliteMapIndex':
+                continue
+            row = self._row_of_generation[int(gen)]
+            start, end = self.selection_indptr[row], self.selection_indptr[row + 1]
+            indices = np.asarray(gen_data['feature_indices'], dtype=index_dtype)
+            if len(indices) != end - start:
+                raise ValueError(f"Generation {gen} changed between passes over the feature log")
+            # Store contribution values instead of binary
+            contributions = np.asarray(gen_data['feature_contribution'], dtype=np.float32)[indices]
+            self.selected_features[start:end] = indices
+            self.selected_contributions[start:end] = contributions
+            feature_counts[row] = len(indices)
+            avg_contributions[row] = np.mean(contributions, dtype=np.float64)
+            contribution_spreads[row] = np.max(contributions) - np.min(contributions)
+            max_feature_index = max(max_feature_index, int(np.max(indices)))
+
+        self.feature_counts = feature_counts.tolist()
+        self.avg_contributions = avg_contributions.tolist()
+        self.contribution_spreads = contribution_spreads.tolist()
+        self.max_feature_index = max_feature_index
+
+        shape = (len(self.generations), self.max_feature_index + 1)
+        self.feature_matrix = sparse.csr_matrix(
+            (self.selected_contributions, self.selected_features, self.selection_indptr), shape=shape)
+        # generations x features boolean matrix of which features were selected in each generation
+        self.selection_incidence = sparse.csr_matrix(
+            (np.ones(nnz, dtype=bool), self.selected_features, self.selection_indptr), shape=shape)
+
+    def generation_selection(self, gen):
+        """Selected feature indices and their contributions for one generation, in their original order."""
+        row = self._row_of_generation[int(gen)]
+        start, end = self.selection_indptr[row], self.selection_indptr[row + 1]
+        return self.selected_features[start:end], self.selected_contributions[start:end]
+
+    def generation_rows(self, start_gen=None, end_gen=None):
+        """Row range of feature_matrix covering generations start_gen <= generation < end_gen."""
+        generations = np.asarray(self.generations)
+        start = 0 if start_gen is None else int(np.searchsorted(generations, start_gen, side='left'))
+        end = len(generations) if end_gen is None else int(np.searchsorted(generations, end_gen, side='left'))
+        return start, end
+
+    def feature_matrix_slice(self, start_gen=None, end_gen=None):
+        """Sparse contribution rows for generations start_gen <= generation < end_gen, and those generations."""
+        start, end = self.generation_rows(start_gen, end_gen)
+        return self.feature_matrix[start:end], self.generations[start:end]
+
+    def downsampled_feature_matrix(self, max_rows=1000, start_gen=None, end_gen=None):
+        """Dense float32 contribution matrix with at most max_rows rows.
+
+        Consecutive generations are averaged into bins, computed as one sparse
+        product, so only the downsampled matrix is ever dense.  Returns the matrix
+        and the first generation of each bin; for a range without generations, a
+        matrix with no rows and no generations.
+        """
+        matrix, generations = self.feature_matrix_slice(start_gen, end_gen)
+        n_rows = matrix.shape[0]
+        if n_rows == 0:
+            return np.zeros((0, matrix.shape[1]), dtype=np.float32), []
+        n_bins = min(max_rows, n_rows)
+        bin_of_row = (np.arange(n_rows) * n_bins) // n_rows
+        bin_sizes = np.bincount(bin_of_row, minlength=n_bins).astype(np.float32)
+        averaging = sparse.csr_matrix(
+            (1.0 / bin_sizes[bin_of_row], (bin_of_row, np.arange(n_rows))),
+            shape=(n_bins, n_rows), dtype=np.float32)
+        downsampled = (averaging @ matrix).toarray().astype(np.float32, copy=False)
+        bin_starts = np.searchsorted(bin_of_row, np.arange(n_bins))
+        bin_generations = [generations[i] for i in bin_starts if i < n_rows]
+        return downsampled, bin_generations
+
+    def coselection_matrix(self):
+        """Sparse features x features matrix of how many generations each pair of features was selected together.
+
+        The diagonal holds how many generations each feature was selected in.
+        """
+        incidence = self.selection_incidence.astype(np.int32)
+        return (incidence.T @ incidence).tocsr()
 
     def plot_evolution_metrics(self, save_path=None):
         plt.figure(figsize=(10, 6))
@@ -66,11 +164,16 @@ class FeatureEvolutionAnalyzer:
             plt.close()
         return plt.gcf()
 
-    def plot_feature_retention_heatmap(self, save_path=None):
+    def plot_feature_retention_heatmap(self, save_path=None, max_rows=1000, start_gen=None, end_gen=None):
+        matrix, bin_generations = self.downsampled_feature_matrix(max_rows, start_gen, end_gen)
+        if not bin_generations:
+            raise ValueError(f"No generations between {start_gen} and {end_gen} to plot")
+        import pandas as pd
+        import seaborn as sns
         plt.figure(figsize=(12, 8))
-        sns.heatmap(self.feature_matrix, cmap='viridis',
+        sns.heatmap(pd.DataFrame(matrix, index=bin_generations), cmap='viridis',
                   xticklabels='auto', 
-                  yticklabels=self.generations[::50])
+                  yticklabels='auto')
         plt.xlabel('Feature Index')
         plt.ylabel('Generation')
         plt.title('Feature Retention Across Generations')
@@ -82,15 +185,13 @@ class FeatureEvolutionAnalyzer:
 
     def plot_contribution_distributions(self, sample_gens=None, save_path=None):
         if sample_gens is None:
-            all_gens = sorted([int(g) for g in self.data.keys() if g != 'eliteMapIndex'])
+            all_gens = self.generations
             indices = np.linspace(0, len(all_gens)-1, 5).astype(int)
             sample_gens = [all_gens[i] for i in indices]
         
         contributions = []
         for gen in sample_gens:
-            gen_str = str(gen)
-            indices = self.data[gen_str]['feature_indices']
-            gen_contributions = [self.data[gen_str]['feature_contribution'][i] for i in indices]
+            _, gen_contributions = self.generation_selection(gen)
             contributions.append(gen_contributions)
         
         plt.figure(figsize=(10, 6))
@@ -106,17 +207,13 @@ class FeatureEvolutionAnalyzer:
         return plt.gcf()
 
     def plot_coselection_network(self, min_cooccurrence=0.5, save_path=None):
-        cooccurrence = np.zeros((self.max_feature_index + 1, self.max_feature_index + 1))
-        
-        for gen_data in self.data.values():
-            if isinstance(gen_data, dict) and 'feature_indices' in gen_data:
-                indices = gen_data['feature_indices']
-                for i in indices:
-                    for j in indices:
-                        cooccurrence[i,j] += 1
+        import networkx as nx
+        cooccurrence = self.coselection_matrix()
         
         threshold = min_cooccurrence * len(self.generations)
-        G = nx.from_numpy_array(cooccurrence > threshold)
+        cooccurrence.data = (cooccurrence.data > threshold).astype(np.int8)
+        cooccurrence.eliminate_zeros()
+        G = nx.from_scipy_sparse_array(cooccurrence)
         
         plt.figure(figsize=(12, 12))
         pos = nx.spring_layout(G)
@@ -130,8 +227,9 @@ class FeatureEvolutionAnalyzer:
         return plt.gcf()
 
     def plot_sankey(self, sample_gens=None, max_features=20, save_path=None):
+        import plotly.graph_objects as go
         if sample_gens is None:
-            all_gens = sorted([int(g) for g in self.data.keys() if g != 'eliteMapIndex'])
+            all_gens = self.generations
             indices = np.linspace(0, len(all_gens)-1, 5).astype(int)
             sample_gens = [all_gens[i] for i in indices]
         
@@ -141,8 +239,8 @@ class FeatureEvolutionAnalyzer:
         
         for i in range(len(sample_gens) - 1):
             gen1, gen2 = str(sample_gens[i]), str(sample_gens[i+1])
-            features1 = self.data[gen1]['feature_indices'][:max_features]
-            features2 = self.data[gen2]['feature_indices'][:max_features]
+            features1 = self.generation_selection(gen1)[0][:max_features].tolist()
+            features2 = self.generation_selection(gen2)[0][:max_features].tolist()
             
             for f in features1 + features2:
                 for gen in [gen1, gen2]:
@@ -174,18 +272,18 @@ class FeatureEvolutionAnalyzer:
         return fig
 
     def plot_alluvial(self, sample_gens=None, max_features=15, save_path=None):
+        import pandas as pd
+        import plotly.express as px
         if sample_gens is None:
-            all_gens = sorted([int(g) for g in self.data.keys() if g != 'eliteMapIndex'])
+            all_gens = self.generations
             indices = np.linspace(0, len(all_gens)-1, 4).astype(int)
             sample_gens = [all_gens[i] for i in indices]
         
         df_records = []
         for gen in sample_gens:
-            gen_str = str(gen)
-            indices = self.data[gen_str]['feature_indices']
-            contributions = [self.data[gen_str]['feature_contribution'][i] for i in indices]
-            features = indices[:max_features]
-            feature_contribs = contributions[:max_features]
+            indices, contributions = self.generation_selection(gen)
+            features = indices[:max_features].tolist()
+            feature_contribs = contributions[:max_features].tolist()
             
             for f, c in zip(features, feature_contribs):
                 df_records.append({
@@ -206,17 +304,14 @@ class FeatureEvolutionAnalyzer:
 
     def plot_bump_chart(self, sample_gens=None, max_features=10, save_path=None):
       if sample_gens is None:
-          all_gens = sorted([int(g) for g in self.data.keys() if g != 'eliteMapIndex'])
+          all_gens = self.generations
           sample_gens = all_gens[::len(all_gens)//10]
       
       feature_ranks = {}
       for gen in sample_gens:
-          gen_str = str(gen)
-          gen_data = self.data[gen_str]
-          indices = gen_data['feature_indices']
-          contributions = [gen_data['feature_contribution'][i] for i in indices]
+          indices, contributions = self.generation_selection(gen)
           
-          feature_contribs = list(zip(indices, contributions))
+          feature_contribs = list(zip(indices.tolist(), contributions.tolist()))
           sorted_features = sorted(feature_contribs, key=lambda x: x[1], reverse=True)[:max_features]
           
           for rank, (feature, _) in enumerate(sorted_features, 1):
@@ -256,15 +351,18 @@ class FeatureEvolutionAnalyzer:
       return plt.gcf()
 
     def plot_parallel_sets(self, sample_gens=None, max_features=15, save_path=None):
+        import pandas as pd
+        import plotly.graph_objects as go
         if sample_gens is None:
-            all_gens = sorted([int(g) for g in self.data.keys() if g != 'eliteMapIndex'])
+            all_gens = self.generations
             indices = np.linspace(0, len(all_gens)-1, 4).astype(int)
             sample_gens = [all_gens[i] for i in indices]
         
         df_records = []
         for gen in sample_gens:
-            features = self.data[str(gen)]['feature_indices'][:max_features]
-            contributions = self.data[str(gen)]['feature_contribution'][:max_features]
+            indices, gen_contributions = self.generation_selection(gen)
+            features = indices[:max_features].tolist()
+            contributions = gen_contributions[:max_features].tolist()
             
             for f, c in zip(features, contributions):
                 df_records.append({
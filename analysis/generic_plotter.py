@@ -31,14 +31,6 @@ import textwrap
 
 # concrete example: python3 generic_plotter.py /Users/bjornpjo/QD/analysis/unsupervised/singleMapBDs-test/evoConf_single-map_x100_noOsc_spectralCentroidAndFlatness__2024-09/analysis/coverage/evolution-run-analysis_coverage_step-100_1730552000155.json /Users/bjornpjo/QD/analysis/unsupervised/singleMapBDs-test/evoConf_singleMap_refSingleEmbeddings_x100_mfcc-sans0_pca_retrainIncr50withAllDiscoveredFeatures/analysis/coverage/evolution-run-analysis_coverage_step-100_1730551989151.json /Users/bjornpjo/QD/analysis/unsupervised/singleMapBDs-test/evoConf_singleMap_refSingleEmbeddings_x100_mfcc_pca_surpriseSelectorWithAE__2024-10/analysis/coverage/evolution-run-analysis_coverage_step-100_1730552012949.json 'Manual' 'retr. w. all' 'surprise sel.' -- 100 coverage customRef1 ./ 'Coverage' Iteration Combined_Results inside -0.05 -0.2 palettable_Set2_3
 
-def get_nested_value(data, path, terrain=None):
-    """Traverse nested dictionary using a list of keys, with optional terrain key"""
-    for key in path:
-        data = data[key]
-    if terrain is not None:
-        data = data[terrain]
-    return data
-
 def create_shortened_label(label):
     """Create a shortened version of the label, focusing on the most distinctive parts."""
     parts = label.split('_')
@@ -165,13 +157,15 @@ def main():
 
     ax = fig.add_axes([left_margin, bottom_margin, right_margin - left_margin, top_margin - bottom_margin])
 
+    # Extract only the aggregate series for data_path from each analysis file, once;
+    # the scans below all reuse these
+    datasets = [plotUtil.read_aggregate_series(json_file, data_path, terrain) for json_file in json_files]
+
     # First scan to find the actual maximum data length
     maxIterations = 0
-    for json_file in json_files:
-        data = plotUtil.read_data_from_json(json_file)
-        for oneEvorun in data['evoRuns']:
-            nested_data = get_nested_value(oneEvorun, ['aggregates'] + data_path, terrain)
-            maxIterations = max(maxIterations, len(nested_data['means']))
+    for evoRuns in datasets:
+        for oneEvorun in evoRuns:
+            maxIterations = max(maxIterations, len(oneEvorun['means']))
     
     print(f"####### Maximum data points found: {maxIterations}")
 
@@ -179,7 +173,7 @@ def main():
     legend_lookup = {}  # Initialize empty dictionary for legend lookup
 
     # Count total number of lines to plot
-    total_lines = sum(len(plotUtil.read_data_from_json(json_file)['evoRuns']) for json_file in json_files)
+    total_lines = sum(len(evoRuns) for evoRuns in datasets)
     
     # Create line styles list that matches the number of lines
     base_line_styles = ['-', '--', ':', '-.', (0, (3, 1, 1, 1)), (0, (5, 10))]
@@ -199,15 +193,12 @@ def main():
     ax.set_prop_cycle(linestyle_cycler)
 
     # Process each JSON file
-    for i, json_file_path in enumerate(json_files):
-        data = plotUtil.read_data_from_json(json_file_path)
+    for i, (json_file_path, evoRuns) in enumerate(zip(json_files, datasets)):
         
-        for oneEvorun in data['evoRuns']:
-            nested_data = get_nested_value(oneEvorun, ['aggregates'] + data_path, terrain)
-            
+        for oneEvorun in evoRuns:
             # Use the full data length without slicing
-            means = np.array(nested_data['means'])
-            stdDevs = np.array(nested_data['stdDevs'])
+            means = oneEvorun['means']
+            stdDevs = oneEvorun['stdDevs']
 
             x_values = np.arange(len(means)) * x_multiplier
 
@@ -229,7 +220,7 @@ def main():
         ax.legend(legend_lines, 
                  [legend_lookup[f"{custom_labels[i] if custom_labels else path.split('/')[-1].split('.')[0]}-{run['label']}"] 
                   for i, path in enumerate(json_files) 
-                  for run in plotUtil.read_data_from_json(path)['evoRuns']],
+                  for run in datasets[i]],
                  bbox_to_anchor=(1.02, 1),
                  loc='upper left',
                  borderaxespad=0,
@@ -241,7 +232,7 @@ def main():
             ax.legend(legend_lines,
                      [legend_lookup[f"{custom_labels[i] if custom_labels else path.split('/')[-1].split('.')[0]}-{run['label']}"]
                       for i, path in enumerate(json_files)
-                      for run in plotUtil.read_data_from_json(path)['evoRuns']],
+                      for run in datasets[i]],
                      bbox_to_anchor=(legend_x, legend_y),
                      loc='center',
                      frameon=True,
@@ -253,7 +244,7 @@ def main():
             ax.legend(legend_lines,
                      [legend_lookup[f"{custom_labels[i] if custom_labels else path.split('/')[-1].split('.')[0]}-{run['label']}"]
                       for i, path in enumerate(json_files)
-                      for run in plotUtil.read_data_from_json(path)['evoRuns']],
+                      for run in datasets[i]],
                      loc='best',
                      frameon=True,
                      borderaxespad=0,
@@ -1,5 +1,5 @@
 import sys
-import json
+import plotUtil
 import matplotlib.pyplot as plt
 import numpy as np
 from cycler import cycler
@@ -8,8 +8,7 @@ colors = Set1_3.mpl_colors
 
 def plot_genome_count_statistics(data_file_path, plot_file_path):
     # Read the JSON file
-    with open(data_file_path, 'r') as file:
-        data = json.load(file)
+    data = plotUtil.read_data_from_json(data_file_path)
 
     # Extract the relevant data
     stats = data['evoRuns'][0]['aggregates']['genomeSetsThroughRenderingVariations']['genomeCount']
@@ -20,7 +20,8 @@ if len(sys.argv) > 3:
 else:
     save_dir = './'
 
-data = plotUtil.read_data_from_json(json_file_path)
+genomeCountRuns, nodeAndConnectionCountRuns = plotUtil.read_aggregate_series(
+    json_file_path, ['genomeSets.genomeCounts', 'genomeSets.nodeAndConnectionCountSetCounts'])
 
 legend_lookup = {
     'one_comb-dur_0.5': 'SIE 0.5s',
@@ -46,9 +47,9 @@ cm = 1/2.54  # centimeters in inches
 plt.figure(figsize=(6*cm, 4.5*cm))
 
 legend_lines = []
-for oneEvorun in data['evoRuns']:
-    genomeCountsMeans = np.array(oneEvorun['aggregates']['genomeSets']['genomeCounts']['means'])
-    genomeCountsStdDevs = np.array(oneEvorun['aggregates']['genomeSets']['genomeCounts']['stdDevs'])
+for oneEvorun in genomeCountRuns:
+    genomeCountsMeans = oneEvorun['means']
+    genomeCountsStdDevs = oneEvorun['stdDevs']
 
     x_values = np.arange(len(genomeCountsMeans)) * x_multiplier
 
@@ -64,7 +65,7 @@ for oneEvorun in data['evoRuns']:
 
     legend_lines.append((line, fill))
 
-plt.legend(legend_lines, [legend_lookup[oneEvorun['label']] for oneEvorun in data['evoRuns']], title='Genome sets') # loc='upper left'
+plt.legend(legend_lines, [legend_lookup[oneEvorun['label']] for oneEvorun in genomeCountRuns], title='Genome sets') # loc='upper left'
 # plt.subplots_adjust(left=0.08, bottom=0.1, right=0.99, top=0.95, wspace=0.2, hspace=0.2)
 
 plt.xlabel('Iteration')
@@ -84,9 +85,9 @@ plt.clf()
 # coarse sets, based on actual difference in genome- and connnection counts, rather than just ID differences:
 
 legend_lines = []
-for oneEvorun in data['evoRuns']:
-    nodeAndConnectionCountMeans = np.array(oneEvorun['aggregates']['genomeSets']['nodeAndConnectionCountSetCounts']['means'])
-    nodeAndConnectionCountStdDevs = np.array(oneEvorun['aggregates']['genomeSets']['nodeAndConnectionCountSetCounts']['stdDevs'])
+for oneEvorun in nodeAndConnectionCountRuns:
+    nodeAndConnectionCountMeans = oneEvorun['means']
+    nodeAndConnectionCountStdDevs = oneEvorun['stdDevs']
 
     x_values = np.arange(len(nodeAndConnectionCountMeans)) * x_multiplier
 
@@ -98,7 +99,7 @@ for oneEvorun in data['evoRuns']:
 
     legend_lines.append((line, fill))
 
-plt.legend(legend_lines, [legend_lookup[oneEvorun['label']] for oneEvorun in data['evoRuns']]) # loc='upper left' # , title='Node and connection count sets'
+plt.legend(legend_lines, [legend_lookup[oneEvorun['label']] for oneEvorun in nodeAndConnectionCountRuns]) # loc='upper left' # , title='Node and connection count sets'
 
 plt.xlabel('Iteration')
 plt.ylabel('Unique genomes')
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import os
+import sys
+import re
+import json
+import argparse
+import subprocess
+
+# Checks the cold-start import cost of analysis scripts against the budgets recorded in
+# import_time_budgets.json, using `python -X importtime`.  Exits with status 1 if a script
+# exceeds its budget or fails to import; scripts whose (optional) dependencies are not
+# installed are reported as skipped.
+#
+#   python3 import_time_budget.py                  # check every script in the budget file
+#   python3 import_time_budget.py feature_evolution_analyser.py
+#   python3 import_time_budget.py --update         # record current costs (with headroom) as budgets
+
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGETS_PATH = os.path.join(ANALYSIS_DIR, 'import_time_budgets.json')
+
+# Budgets recorded by --update are the measured cost times HEADROOM, and at least
+# MIN_SLACK_MS above it, so cold caches and machine load do not fail the check
+HEADROOM = 2.0
+MIN_SLACK_MS = 50
+
+# Loads a script as a module without running its __main__ block
+PROBE = '''
+import importlib.util, os, sys
+path = sys.argv[1]
+sys.path.insert(0, os.path.dirname(path))
+spec = importlib.util.spec_from_file_location('_import_time_probe', path)
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+'''
+
+class MissingDependency(Exception):
+    pass
+
+def parse_importtime(stderr):
+    """Per-module self times in microseconds from -X importtime output."""
+    self_times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        self_times[fields[2].strip()] = self_times.get(fields[2].strip(), 0) + int(fields[0])
+    return self_times
+
+def measure_import_time(args):
+    """Total import self time in ms, and per-module times, for one run of python -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, capture_output=True, text=True)
+    if result.returncode != 0:
+        missing = re.search(r"ModuleNotFoundError: No module named '([^']+)'", result.stderr)
+        if missing:
+            raise MissingDependency(missing.group(1))
+        raise RuntimeError(f"Import failed:\n{result.stderr[-2000:]}")
+    self_times = parse_importtime(result.stderr)
+    return sum(self_times.values()) / 1000, self_times
+
+def measure_script(script, repeat=5):
+    """Best-of-repeat import cost of a script in ms, minus the interpreter's own startup imports."""
+    path = os.path.join(ANALYSIS_DIR, script)
+    # Untimed warm-up, so the first measured run does not pay for writing .pyc files
+    # and pulling the dependencies' files into the OS page cache
+    measure_import_time(['-c', PROBE, path])
+    baseline = min(measure_import_time(['-c', 'pass'])[0] for _ in range(repeat))
+    runs = [measure_import_time(['-c', PROBE, path]) for _ in range(repeat)]
+    total, self_times = min(runs, key=lambda run: run[0])
+    return total - baseline, self_times
+
+def main():
+    parser = argparse.ArgumentParser(description='Check analysis script import times against recorded budgets')
+    parser.add_argument('scripts', nargs='*', help='Scripts relative to the analysis directory (default: all in the budget file)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per script after an untimed warm-up; the fastest is used (default: 5)')
+    parser.add_argument('--update', action='store_true', help=f'Record the measured costs, times {HEADROOM:g} and at least {MIN_SLACK_MS} ms over, as the new budgets')
+    parser.add_argument('--top', type=int, default=5, help='Number of slowest modules to list for scripts over budget')
+    args = parser.parse_args()
+
+    with open(BUDGETS_PATH) as f:
+        budgets = json.load(f)
+    scripts = args.scripts or sorted(budgets)
+
+    over_budget = []
+    for script in scripts:
+        try:
+            cost, self_times = measure_script(script, args.repeat)
+        except MissingDependency as e:
+            print(f"{script}: skipped, {e} is not installed")
+            continue
+        except RuntimeError as e:
+            print(f"{script}: {e}")
+            over_budget.append(script)
+            continue
+        budget = budgets.get(script)
+        if args.update:
+            budgets[script] = int(round(max(cost * HEADROOM, cost + MIN_SLACK_MS), -1))
+            print(f"{script}: {cost:.0f} ms, budget set to {budgets[script]} ms")
+        elif budget is None:
+            print(f"{script}: {cost:.0f} ms (no budget recorded)")
+        elif cost > budget:
+            over_budget.append(script)
+            print(f"{script}: {cost:.0f} ms exceeds budget of {budget} ms; slowest imports:")
+            for module, us in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+                print(f"    {us / 1000:8.1f} ms  {module}")
+        else:
+            print(f"{script}: {cost:.0f} ms (budget {budget} ms)")
+
+    if args.update:
+        with open(BUDGETS_PATH, 'w') as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+            f.write('\n')
+    elif over_budget:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,345 @@
+import os
 import json
+from array import array
+from collections import OrderedDict
 import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgba
 import numpy as np
 
+try:
+    import ijson  # event-based JSON parser, used for bounded-memory extraction
+except ImportError:
+    ijson = None
+
 def add_numbers(x, y):
     return x + y
 
-# Read data from JSON file
+# Parsed analysis files, kept in least-recently-used order and bounded by their
+# on-disk size (a cheap stand-in for the resident size of the parsed document).
+# A file is only cached once it is read a second time: most scripts read each
+# file once, and for them caching (and copying out of the cache) is pure cost
+JSON_CACHE_MAX_BYTES = int(os.environ.get('KROMOSYNTH_PLOT_CACHE_BYTES', 2 * 1024 ** 3))
+_json_cache = OrderedDict()
+_json_cache_bytes = 0
+# Keys read once so far, and not cached
+_json_seen = set()
+
+def _json_cache_key(file_path, columnar=False):
+    stat = os.stat(file_path)
+    return (os.path.realpath(file_path), stat.st_mtime_ns, stat.st_size, columnar)
+
+def clear_json_cache():
+    global _json_cache_bytes
+    _json_cache.clear()
+    _json_seen.clear()
+    _json_cache_bytes = 0
+
+def _copy_document(value):
+    """Copy the dicts and lists of a parsed document, sharing its immutable leaves.
+
+    Cheaper than copy.deepcopy, as there is no memo, but for documents of
+    nested numeric lists about as costly as parsing them, so it is only used
+    for documents served from the cache.
+    """
+    if isinstance(value, dict):
+        return {key: _copy_document(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_document(item) for item in value]
+    return value
+
+def _load_document(file_path, columnar=False):
+    """Parse of file_path (from its columnar sidecar if columnar and fresh), and whether it is the shared cached object.
+
+    A shared document must not be modified.
+    """
+    global _json_cache_bytes
+    key = _json_cache_key(file_path, columnar)
+    if key in _json_cache:
+        _json_cache.move_to_end(key)
+        return _json_cache[key], True
+
+    if columnar and has_fresh_columnar_sidecar(file_path):
+        data = read_columnar_sidecar(file_path)
+    else:
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+
+    # drop stale entries for the same path (the file was rewritten)
+    for stale_key in [k for k in _json_seen if k[0] == key[0] and k[1:3] != key[1:3]]:
+        _json_seen.discard(stale_key)
+    for stale_key in [k for k in _json_cache if k[0] == key[0] and k[1:3] != key[1:3]]:
+        del _json_cache[stale_key]
+        _json_cache_bytes -= stale_key[2]
+
+    size = key[2]
+    if key not in _json_seen or size > JSON_CACHE_MAX_BYTES:
+        _json_seen.add(key)
+        return data, False
+    _json_seen.discard(key)
+    _json_cache[key] = data
+    _json_cache_bytes += size
+    while _json_cache_bytes > JSON_CACHE_MAX_BYTES:
+        evicted_key, _ = _json_cache.popitem(last=False)
+        _json_cache_bytes -= evicted_key[2]
+    return data, True
+
+# Read data from JSON file; a file read more than once per process is parsed only
+# twice, and later reads are served from the cache.  Every call returns a document
+# of its own, so callers may modify it
 def read_data_from_json(file_path):
-    with open(file_path, 'r') as f:
+    data, shared = _load_document(file_path)
+    return _copy_document(data) if shared else data
+
+# Like read_data_from_json, but served from the columnar sidecar when one is newer
+# than the JSON: numeric lists then come back as read-only float64 arrays (None as
+# NaN, integers as floats), so only callers that handle both forms should use it
+def read_columnar_data(file_path):
+    data, shared = _load_document(file_path, columnar=True)
+    return _copy_document(data) if shared else data
+
+# Columnar sidecar: every rectangular numeric list (1-D series, 2-D score matrices,
+# 3-D stacks of them) is moved into one contiguous float64 .npy next to the JSON,
+# which is then memory-mapped; the rest of the document is kept as a skeleton
+# JSON where each moved list is replaced by {"__columns__": [offset, shape]}.
+# None entries become NaN and integers become floats.  The skeleton deliberately
+# does not end in .json, so globs for analysis files do not pick it up.
+COLUMNAR_SKELETON_SUFFIX = '.columns.meta'
+COLUMNAR_VALUES_SUFFIX = '.columns.npy'
+_COLUMNAR_PLACEHOLDER = '__columns__'
+
+def columnar_sidecar_paths(json_path):
+    return json_path + COLUMNAR_SKELETON_SUFFIX, json_path + COLUMNAR_VALUES_SUFFIX
+
+def has_fresh_columnar_sidecar(json_path):
+    skeleton_path, values_path = columnar_sidecar_paths(json_path)
+    if not (os.path.exists(skeleton_path) and os.path.exists(values_path)):
+        return False
+    json_mtime = os.path.getmtime(json_path)
+    return os.path.getmtime(skeleton_path) >= json_mtime and os.path.getmtime(values_path) >= json_mtime
+
+def _numeric_shape(value):
+    """Shape of a rectangular, all-numeric (or None) nested list, else None."""
+    if not isinstance(value, list) or len(value) == 0:
+        return None
+    if all(x is None or (isinstance(x, (int, float)) and not isinstance(x, bool)) for x in value):
+        return (len(value),)
+    inner_shape = _numeric_shape(value[0])
+    if inner_shape is None or len(inner_shape) > 2:
+        return None
+    for x in value[1:]:
+        if _numeric_shape(x) != inner_shape:
+            return None
+    return (len(value),) + inner_shape
+
+def _extract_columns(value, columns, offset):
+    if isinstance(value, dict):
+        skeleton = {}
+        for key, item in value.items():
+            skeleton[key], offset = _extract_columns(item, columns, offset)
+        return skeleton, offset
+    if isinstance(value, list):
+        shape = _numeric_shape(value)
+        if shape is not None:
+            columns.append((offset, shape, value))
+            return {_COLUMNAR_PLACEHOLDER: [offset, list(shape)]}, offset + int(np.prod(shape))
+        skeleton = []
+        for item in value:
+            item_skeleton, offset = _extract_columns(item, columns, offset)
+            skeleton.append(item_skeleton)
+        return skeleton, offset
+    return value, offset
+
+def write_columnar_sidecar(json_path):
+    """Convert an analysis JSON file into its columnar sidecar; returns the sidecar paths."""
+    with open(json_path, 'r') as f:
         data = json.load(f)
-    return data
+    columns = []
+    skeleton, total = _extract_columns(data, columns, 0)
+
+    skeleton_path, values_path = columnar_sidecar_paths(json_path)
+    # write to temporary names and rename, the skeleton last, so a reader never
+    # sees a half-written sidecar
+    values_tmp_path = values_path + '.tmp.npy'
+    values = np.lib.format.open_memmap(values_tmp_path, mode='w+', dtype=np.float64, shape=(total,))
+    for offset, shape, value in columns:
+        values[offset:offset + int(np.prod(shape))] = np.array(value, dtype=float).ravel()
+    values.flush()
+    del values
+    os.replace(values_tmp_path, values_path)
+
+    skeleton_tmp_path = skeleton_path + '.tmp'
+    with open(skeleton_tmp_path, 'w') as f:
+        json.dump(skeleton, f)
+    os.replace(skeleton_tmp_path, skeleton_path)
+    return skeleton_path, values_path
+
+def read_columnar_sidecar(json_path):
+    """Load the document from its columnar sidecar, with numeric arrays as read-only memory-mapped views."""
+    skeleton_path, values_path = columnar_sidecar_paths(json_path)
+    values = np.load(values_path, mmap_mode='r')
+
+    def restore_columns(obj):
+        if len(obj) == 1 and _COLUMNAR_PLACEHOLDER in obj:
+            offset, shape = obj[_COLUMNAR_PLACEHOLDER]
+            return values[offset:offset + int(np.prod(shape))].reshape(shape)
+        return obj
+
+    with open(skeleton_path, 'r') as f:
+        return json.load(f, object_hook=restore_columns)
+
+def _as_float_vector(values):
+    if isinstance(values, np.ndarray):
+        return np.asarray(values, dtype=float)
+    return np.array([np.nan if x is None else x for x in values], dtype=float)
+
+def _aggregate_path(data_path, terrain=None):
+    if isinstance(data_path, str):
+        data_path = data_path.split('.')
+    path = ['aggregates'] + list(data_path)
+    if terrain is not None:
+        path.append(terrain)
+    return path
+
+def _series_from_document(data, path, fields):
+    runs = []
+    for evo_run in data['evoRuns']:
+        nested = evo_run
+        try:
+            for key in path:
+                nested = nested[key]
+        except KeyError:
+            raise KeyError('.'.join(path)) from None
+        run = {'label': evo_run.get('label')}
+        for field in fields:
+            run[field] = _as_float_vector(nested.get(field, []))
+        runs.append(run)
+    return runs
+
+# Extract evoRuns[*].aggregates.<data_path>.<terrain>.{means,stdDevs} as NumPy vectors,
+# streaming over the document so per-iteration payloads are never materialised;
+# raises KeyError with the dotted path if a run does not have it, however it is read.
+# Given a list of data paths, all are extracted in the same pass and a list of
+# per-path results is returned, in the order of data_path
+def read_aggregate_series(file_path, data_path, terrain=None, fields=('means', 'stdDevs')):
+    several = isinstance(data_path, (list, tuple))
+    paths = [_aggregate_path(p, terrain) for p in (data_path if several else [data_path])]
+    if ijson is None or has_fresh_columnar_sidecar(file_path):
+        data = _load_document(file_path, columnar=True)[0]
+        series = [_series_from_document(data, path, fields) for path in paths]
+        return series if several else series[0]
+
+    base_prefixes = {'.'.join(['evoRuns.item'] + path): i for i, path in enumerate(paths)}
+    item_prefixes = {
+        f'{base_prefix}.{field}.item': (i, field)
+        for base_prefix, i in base_prefixes.items() for field in fields
+    }
+    series = [[] for _ in paths]
+    label = None
+    buffers = None
+    found = None
+    with open(file_path, 'rb') as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix in base_prefixes:
+                found.add(base_prefixes[prefix])
+            if prefix in item_prefixes:
+                i, field = item_prefixes[prefix]
+                if event == 'number':
+                    buffers[i][field].append(value)
+                elif event == 'null':
+                    buffers[i][field].append(np.nan)
+            elif prefix == 'evoRuns.item':
+                if event == 'start_map':
+                    label = None
+                    buffers = [{field: array('d') for field in fields} for _ in paths]
+                    found = set()
+                elif event == 'end_map':
+                    for i, path in enumerate(paths):
+                        if i not in found:
+                            raise KeyError('.'.join(path))
+                        run = {'label': label}
+                        for field, buffer in buffers[i].items():
+                            run[field] = np.frombuffer(buffer, dtype=float) if buffer else np.zeros(0)
+                        series[i].append(run)
+            elif prefix == 'evoRuns.item.label' and event == 'string':
+                label = value
+    return series if several else series[0]
+
+# Score matrices come either as a bare list (single map) or keyed by map name
+def score_matrix_maps(payload):
+    if isinstance(payload, (list, np.ndarray)):
+        return {'oneMap': payload}
+    return payload
+
+# Decode a raw scoreMatrix payload (nested lists with None for empty cells) into a
+# float array in one vectorized pass; empty cells are NaN unless fill_value is given
+def decode_score_matrix(matrix, fill_value=None):
+    decoded = np.array(matrix, dtype=float)  # None -> NaN during the conversion
+    if fill_value is not None:
+        decoded[np.isnan(decoded)] = fill_value
+    return decoded
+
+# Names of the maps in any iteration's payload, in the order they first appear
+def score_matrix_map_names(iterations, key='scoreMatrix'):
+    map_names = {}
+    for iteration in iterations:
+        map_names.update(dict.fromkeys(score_matrix_maps(iteration[key])))
+    return list(map_names)
+
+# The iterations whose payload includes map_name
+def iterations_with_map(iterations, map_name, key='scoreMatrix'):
+    return [iteration for iteration in iterations if map_name in score_matrix_maps(iteration[key])]
+
+# Decode one map's matrix from every iteration that has it into a stacked
+# (iterations, rows, cols) array; for 'scoreMatrices' payloads, matrix_index
+# selects the matrix within each map.  Raises ValueError if the matrix shape
+# changes between iterations, as they cannot be stacked
+def stack_score_matrices(iterations, map_name='oneMap', key='scoreMatrix', matrix_index=None, fill_value=None):
+    iterations = iterations_with_map(iterations, map_name, key)
+    iteration_ids = []
+    stack = None
+    for i, iteration in enumerate(iterations):
+        matrix = score_matrix_maps(iteration[key])[map_name]
+        if matrix_index is not None:
+            matrix = matrix[matrix_index]
+        decoded = decode_score_matrix(matrix)
+        if stack is None:
+            stack = np.empty((len(iterations),) + decoded.shape, dtype=float)
+        elif decoded.shape != stack.shape[1:]:
+            raise ValueError(f"Score matrix of map {map_name} has shape {decoded.shape} in iteration {iteration['id']}, "
+                             f"but {stack.shape[1:]} in iteration {iteration_ids[0]}")
+        stack[i] = decoded
+        iteration_ids.append(iteration['id'])
+    if stack is None:
+        stack = np.empty((0, 0, 0), dtype=float)
+    elif fill_value is not None:
+        stack[np.isnan(stack)] = fill_value
+    return iteration_ids, stack
+
+# Draw which cells of an elite map are occupied (non-zero and not NaN) as a single
+# artist: one scatter collection of markers ('markers'), or one RGBA image layer
+# with a filled square per occupied cell ('cells'); both are independent of the
+# number of occupied cells, unlike one scatter call per cell
+def render_occupancy_map(ax, matrix, color, style='markers', marker_size=10):
+    matrix = np.asarray(matrix, dtype=float)
+    occupied = np.nan_to_num(matrix, nan=0.0) != 0
+    if style == 'cells':
+        rgba = np.zeros(occupied.shape + (4,), dtype=float)
+        rgba[occupied] = to_rgba(color)
+        return ax.imshow(rgba, interpolation='nearest', aspect='auto')
+    rows, cols = np.nonzero(occupied)
+    return ax.scatter(cols, rows, color=color, s=marker_size)
+
+# Update an artist returned by render_occupancy_map in place for a new matrix
+def update_occupancy_map(artist, matrix, color):
+    matrix = np.asarray(matrix, dtype=float)
+    occupied = np.nan_to_num(matrix, nan=0.0) != 0
+    if hasattr(artist, 'set_offsets'):
+        rows, cols = np.nonzero(occupied)
+        artist.set_offsets(np.column_stack((cols, rows)))
+    else:
+        rgba = np.zeros(occupied.shape + (4,), dtype=float)
+        rgba[occupied] = to_rgba(color)
+        artist.set_data(rgba)
 
 # Extract data arrays from JSON
 def extract_data_arrays(data, attribute, forceFloat=False):
@@ -71,3 +401,13 @@ def render_graphs(arrays, x_multiplier, plotFunc, subPlotWidth, subPlotHeight, t
     # Add title
     plt.suptitle(title, fontsize=16, y=1.0)
     plt.show()
+
+if __name__ == '__main__':
+    import sys
+    # usage: python3 plotUtil.py <evolution-run-analysis_*.json>... -- writes a columnar sidecar next to each
+    for json_path in sys.argv[1:]:
+        if has_fresh_columnar_sidecar(json_path):
+            print(f"Columnar sidecar is up to date for {json_path}")
+            continue
+        skeleton_path, values_path = write_columnar_sidecar(json_path)
+        print(f"Wrote columnar sidecar {skeleton_path} and {values_path}")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Long-lived plotting daemon that keeps matplotlib and friends imported.
+
+Every plotting command otherwise starts a fresh python3 that spends most of its
+time importing matplotlib, cycler, palettable, seaborn, pandas, plotly and
+networkx before drawing one small figure.  The server imports them once and
+forks a child per job, so each job starts warm but still gets its own copy of
+the global matplotlib state.
+
+Jobs are sent as one line of JSON over a Unix socket and answered with one line
+of JSON, {"returncode": int, "output": str}.  Two kinds of jobs are accepted:
+
+    {"script": "/path/to/generic_plotter.py", "args": [...], "cwd": "..."}
+        run a plotting script as __main__ with sys.argv = [script] + args, which
+        covers generic_plotter.main, the heatmap scripts and the other plot scripts
+
+    {"function": "plot_goal_switches.create_comparison_plot", "args": [...], "kwargs": {...}, "cwd": "..."}
+        call one of the functions listed in FUNCTIONS
+
+Usage:
+    python3 plot_server.py serve [--socket PATH] [--max-jobs N]
+    python3 plot_server.py run [--socket PATH] <script> [args...]
+"""
+import os
+import sys
+import json
+import runpy
+import socket
+import argparse
+import importlib
+import tempfile
+import traceback
+import socketserver
+
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SOCKET_PATH = os.environ.get(
+    'KROMOSYNTH_PLOT_SERVER_SOCKET',
+    os.path.join(tempfile.gettempdir(), f'kromosynth-plot-server-{os.getuid()}.sock')
+)
+
+# Imported once by the server; missing optional libraries are skipped
+WARM_MODULES = [
+    'numpy', 'matplotlib', 'matplotlib.pyplot', 'cycler', 'palettable.colorbrewer.qualitative',
+    'seaborn', 'pandas', 'plotly.graph_objects', 'plotly.express', 'networkx',
+    'plotUtil', 'generic_plotter'
+]
+
+# Functions that can be called directly: name -> (script path, attribute)
+FUNCTIONS = {
+    'generic_plotter.main': (os.path.join(ANALYSIS_DIR, 'generic_plotter.py'), 'main'),
+    'scoreMatrixHeatMap.main': (os.path.join(ANALYSIS_DIR, 'scoreMatrixHeatMap.py'), 'main'),
+    'plot_goal_switches.create_comparison_plot': (os.path.join(ANALYSIS_DIR, 'commands', 'plot_goal_switches.py'), 'create_comparison_plot'),
+}
+
+def warm_up():
+    """Import the plotting libraries, so forked jobs start with them loaded."""
+    sys.path.insert(0, ANALYSIS_DIR)
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+    except ImportError as e:
+        print(f"Not preloading matplotlib: {e}")
+    for module_name in WARM_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            print(f"Not preloading {module_name}: {e}")
+
+def run_job(request):
+    """Run one job in the current (forked) process and return its exit code."""
+    if request.get('cwd'):
+        os.chdir(request['cwd'])
+    if 'script' in request:
+        script = os.path.abspath(request['script'])
+        sys.argv = [script] + [str(arg) for arg in request.get('args', [])]
+        sys.path.insert(0, os.path.dirname(script))
+        runpy.run_path(script, run_name='__main__')
+    elif request.get('function') in FUNCTIONS:
+        script, attribute = FUNCTIONS[request['function']]
+        sys.argv = [script] + [str(arg) for arg in request.get('argv', [])]
+        sys.path.insert(0, os.path.dirname(script))
+        namespace = runpy.run_path(script, run_name=os.path.splitext(os.path.basename(script))[0])
+        namespace[attribute](*request.get('args', []), **request.get('kwargs', {}))
+    else:
+        raise ValueError(f"Unknown job: {request}")
+    return 0
+
+class PlotJobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        # Capture the job's output at the file descriptor level, so output from
+        # any subprocesses it starts is included
+        with tempfile.TemporaryFile(mode='w+') as output:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(output.fileno(), 1)
+            os.dup2(output.fileno(), 2)
+            try:
+                returncode = run_job(request)
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                if not isinstance(e.code, (int, type(None))):
+                    print(e.code)
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+            output.seek(0)
+            response = {'returncode': returncode, 'output': output.read()}
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+class PlotServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, max_jobs=os.cpu_count()):
+    warm_up()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = PlotServer(socket_path, PlotJobHandler)
+    server.max_children = max_jobs
+    print(f"Plot server listening on {socket_path} (max {max_jobs} concurrent jobs)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def is_server_running(socket_path=DEFAULT_SOCKET_PATH):
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+def submit_job(request, socket_path=DEFAULT_SOCKET_PATH):
+    """Send a job to the server and wait for its response."""
+    request = dict(request)
+    request.setdefault('cwd', os.getcwd())
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + '\n').encode())
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
+
+def main():
+    parser = argparse.ArgumentParser(description='Persistent plotting server')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Start the server')
+    serve_parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='Unix socket path')
+    serve_parser.add_argument('--max-jobs', type=int, default=os.cpu_count(), help='Maximum number of concurrent jobs')
+    run_parser = subparsers.add_parser('run', help='Run a plotting script on the server')
+    run_parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='Unix socket path')
+    run_parser.add_argument('script', help='Plotting script to run')
+    run_parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments for the plotting script')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.socket, args.max_jobs)
+    else:
+        response = submit_job({'script': args.script, 'args': args.args}, args.socket)
+        print(response['output'], end='')
+        sys.exit(response['returncode'])
+
+if __name__ == '__main__':
+    main()
@@ -30,7 +30,7 @@ if len(sys.argv) > 4:
 else:
     terrain = "customRef1"
 
-data = plotUtil.read_data_from_json(json_file_path)
+evoRuns = plotUtil.read_aggregate_series(json_file_path, 'qdScores', terrain)
 
 # # 90% confidence interval
 # # z_score = 1.645
@@ -77,7 +77,7 @@ plt.figure(figsize=(4*cm, 3*cm))
 maxIterations = 48 # divided by x_multiplier
 print("maxIterations:" + str(maxIterations) + " (divided by x_multiplier)")
 legend_lines = []
-for oneEvorun in data['evoRuns']:
+for oneEvorun in evoRuns:
     # add oneEvorun to legend_lookup if not already present, with a shortened name as the value in the dictionary
     if oneEvorun['label'] not in legend_lookup:
         parts = oneEvorun['label'].split('_')
@@ -88,11 +88,11 @@ for oneEvorun in data['evoRuns']:
         legend_lookup[oneEvorun['label']] = shortened_label
 
 
-    qdScoresMeans = np.array(oneEvorun['aggregates']['qdScores'][terrain]['means'])[:maxIterations]
+    qdScoresMeans = oneEvorun['means'][:maxIterations]
 
     print(qdScoresMeans)
 
-    qdSqoreStdDevs = np.array(oneEvorun['aggregates']['qdScores'][terrain]['stdDevs'])[:maxIterations]
+    qdSqoreStdDevs = oneEvorun['stdDevs'][:maxIterations]
 
     print(len(qdScoresMeans))
 
@@ -118,7 +118,7 @@ for oneEvorun in data['evoRuns']:
 
     legend_lines.append((line, fill))
 
-plt.legend(legend_lines, [legend_lookup[oneEvorun['label']] for oneEvorun in data['evoRuns']]) # loc='upper left' 3 title='QD scores'
+plt.legend(legend_lines, [legend_lookup[oneEvorun['label']] for oneEvorun in evoRuns]) # loc='upper left' 3 title='QD scores'
 
 # plt.subplots_adjust(left=0.2, bottom=0.2, right=0.94, top=0.98, wspace=0.2, hspace=0.2)
 
@@ -71,7 +71,7 @@ if len(sys.argv) > 5:
 print(f'Hide zeros: {hide_zeros}')
 print(f'Using colormap: {colormap_name}')
 
-data = plotUtil.read_data_from_json(json_file_path)
+data = plotUtil.read_columnar_data(json_file_path)
 
 # Iterate over all iterations
 for iteration in data['evoRuns'][0]['iterations']:
@@ -79,8 +79,7 @@ for iteration in data['evoRuns'][0]['iterations']:
     iteration_id = iteration['id']
 
     # if scoreMatrix is an array
-    if isinstance(scoreMatrices, list):
-        scoreMatrices = {'oneMap': scoreMatrices}
+    scoreMatrices = plotUtil.score_matrix_maps(scoreMatrices)
     
     for oneMap in scoreMatrices:
         # Iterate over each matrix in scoreMatrices
@@ -88,8 +87,7 @@ for iteration in data['evoRuns'][0]['iterations']:
             print(f'Plotting matrix {idx} for iteration {iteration_id}')
 
             # Convert to numpy array and handle None values
-            matrix = np.array(matrix)
-            matrix = np.array([[0 if x is None else x for x in row] for row in matrix], dtype=float)
+            matrix = plotUtil.decode_score_matrix(matrix, fill_value=0)
 
             # Get the colormap
             cmap = AVAILABLE_COLORMAPS[colormap_name]
@@ -1,7 +1,13 @@
+import os
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import plotUtil
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.animation import FFMpegWriter
+from matplotlib.backends.backend_pdf import PdfPages
 from matplotlib.colors import LinearSegmentedColormap
 
 # https://github.com/jbmouret/matplotlib_for_papers#setting-the-limits-and-the-ticks
@@ -43,96 +49,281 @@ AVAILABLE_COLORMAPS = {
 }
 
 cm = 1/2.54  # centimeters in inches
+FIGURE_SIZE = (40*cm, 30*cm)
 
-plt.figure(figsize=(40*cm, 30*cm))
+def plot_score_matrix(fig, matrix, oneMap, coverage, hide_zeros, constant_color, colormap_name):
+    """Draw one score matrix heatmap onto a cleared figure."""
+    fig.clf()
+    ax = fig.add_subplot()
 
-json_file_path = sys.argv[1]
-title = "scoreMatrix_" + json_file_path.split('/')[4]
+    if constant_color:
+        ax.imshow(np.ones_like(matrix), cmap='gray', interpolation='nearest', aspect='auto')
+        ax.invert_yaxis()
+        plotUtil.render_occupancy_map(ax, matrix, constant_color, marker_size=10)
+    else:
+        cmap = AVAILABLE_COLORMAPS[colormap_name]
+        if hide_zeros:
+            masked_matrix = np.ma.masked_where(matrix == 0, matrix)
+            ax.imshow(np.zeros_like(matrix), cmap='gray', alpha=0)
+            im = ax.imshow(masked_matrix, cmap=cmap, interpolation='nearest', 
+                          aspect='auto', vmin=0, vmax=1)
+        else:
+            im = ax.imshow(matrix, cmap=cmap, interpolation='nearest', 
+                          aspect='auto', vmin=0, vmax=1)
+        
+        ax.invert_yaxis()
+        fig.colorbar(im, ax=ax, label='Score')
 
-if len(sys.argv) > 3:
-     save_dir = sys.argv[3]
-else:
-     save_dir = './'
+    # if 'X' in oneMap:
+    #     labels = oneMap.split('X')
+    #     plt.xlabel(labels[0])
+    #     plt.ylabel(labels[1])
+    # else:
+    #     plt.xlabel('Cell index')
+    #     plt.ylabel('Cell index')
+    ax.set_xlabel('spectral slope')
+    ax.set_ylabel('spectral rolloff')
 
-hide_zeros = True
-constant_color = None
-colormap_name = 'blue-yellow'  # default colormap
+    if coverage is not None:
+        # Modify the oneMap string for the title
+        title_oneMap = oneMap.replace("refSingleEmb_mfcc-sans0-statistics_", "").replace("_retrainIncr50_zScoreNSynthTrain", "")
+        ax.set_title(f"{title_oneMap}\nCoverage: {coverage}%")
 
-# Parse arguments
-if len(sys.argv) > 4:
-    arg = sys.argv[4].lower()
-    if arg == 'true' or arg == 'false':
-        hide_zeros = (arg == 'true')
-    elif arg in AVAILABLE_COLORMAPS:
-        colormap_name = arg
+def save_score_matrix_figure(fig, filename, hide_zeros):
+    print('Saving figure to ' + filename + '.ext')
+    if hide_zeros:
+        fig.savefig(filename + '.pdf', transparent=True, bbox_inches='tight')
     else:
-        constant_color = sys.argv[4]
-
-if len(sys.argv) > 5:
-    arg = sys.argv[5].lower()
-    if arg in AVAILABLE_COLORMAPS:
-        colormap_name = arg
-
-print(f'Hide zeros: {hide_zeros}')
-print(f'Constant color: {constant_color}')
-print(f'Using colormap: {colormap_name}')
-
-data = plotUtil.read_data_from_json(json_file_path)
-
-for iteration in data['evoRuns'][0]['iterations']:
-    scoreMatrix = iteration['scoreMatrix']
-    iteration_id = iteration['id']
-    
-    if isinstance(scoreMatrix, list):
-        scoreMatrix = {'oneMap': scoreMatrix}
-    for oneMap in scoreMatrix:
-        print('Plotting ' + oneMap + ' for iteration ' + str(iteration_id))
-
-        matrix = np.array(scoreMatrix[oneMap])
-        matrix = np.array([[0 if x is None else x for x in row] for row in matrix], dtype=float)
-
-        if constant_color:
-            plt.imshow(np.ones_like(matrix), cmap='gray', interpolation='nearest', aspect='auto')
-            plt.gca().invert_yaxis()
-            for (i, j), val in np.ndenumerate(matrix):
-                if val != 0:
-                    plt.scatter(j, i, color=constant_color, s=10)
-        else:
-            cmap = AVAILABLE_COLORMAPS[colormap_name]
-            if hide_zeros:
-                masked_matrix = np.ma.masked_where(matrix == 0, matrix)
-                plt.imshow(np.zeros_like(matrix), cmap='gray', alpha=0)
-                im = plt.imshow(masked_matrix, cmap=cmap, interpolation='nearest', 
-                              aspect='auto', vmin=0, vmax=1)
-            else:
-                im = plt.imshow(matrix, cmap=cmap, interpolation='nearest', 
-                              aspect='auto', vmin=0, vmax=1)
-            
-            plt.gca().invert_yaxis()
-            plt.colorbar(im, label='Score')
-
-        # if 'X' in oneMap:
-        #     labels = oneMap.split('X')
-        #     plt.xlabel(labels[0])
-        #     plt.ylabel(labels[1])
-        # else:
-        #     plt.xlabel('Cell index')
-        #     plt.ylabel('Cell index')
-        plt.xlabel('spectral slope')
-        plt.ylabel('spectral rolloff')
-
-        if 'coveragePercentage' in iteration and oneMap in iteration['coveragePercentage']:
-            coverage = iteration['coveragePercentage'][oneMap]
-            # Modify the oneMap string for the title
-            title_oneMap = oneMap.replace("refSingleEmb_mfcc-sans0-statistics_", "").replace("_retrainIncr50_zScoreNSynthTrain", "")
-            plt.title(f"{title_oneMap}\nCoverage: {coverage}%")
-
-        filename = f"{save_dir}{oneMap}_iteration_{iteration_id}"
-        print('Saving figure to ' + filename + '.ext')
+        fig.savefig(filename + '.pdf')
+
+def iteration_coverage(iteration, oneMap):
+    if 'coveragePercentage' in iteration and oneMap in iteration['coveragePercentage']:
+        return iteration['coveragePercentage'][oneMap]
+    return None
+
+def render_serially(iterations, save_dir, hide_zeros, constant_color, colormap_name):
+    fig = plt.figure(figsize=FIGURE_SIZE)
+    for iteration in iterations:
+        scoreMatrix = plotUtil.score_matrix_maps(iteration['scoreMatrix'])
+        iteration_id = iteration['id']
+        for oneMap in scoreMatrix:
+            print('Plotting ' + oneMap + ' for iteration ' + str(iteration_id))
+            matrix = plotUtil.decode_score_matrix(scoreMatrix[oneMap], fill_value=0)
+            plot_score_matrix(fig, matrix, oneMap, iteration_coverage(iteration, oneMap),
+                              hide_zeros, constant_color, colormap_name)
+            save_score_matrix_figure(fig, f"{save_dir}{oneMap}_iteration_{iteration_id}", hide_zeros)
+    plt.close(fig)
+
+# State held by each rendering worker process: its own Agg figure and read-only
+# memory maps of the decoded (iterations, rows, cols) stacks, one per map
+_worker = {}
+
+def _init_render_worker(stack_paths, options):
+    matplotlib.use('Agg')
+    plt.rcParams.update(params)
+    _worker['stacks'] = {stack_key: np.load(path, mmap_mode='r') for stack_key, path in stack_paths.items()}
+    _worker['options'] = options
+    _worker['fig'] = plt.figure(figsize=FIGURE_SIZE)
+
+def _render_job(job):
+    stack_key, position, iteration_id, oneMap, coverage = job
+    options = _worker['options']
+    matrix = np.asarray(_worker['stacks'][stack_key][position])
+    plot_score_matrix(_worker['fig'], matrix, oneMap, coverage,
+                      options['hide_zeros'], options['constant_color'], options['colormap_name'])
+    filename = f"{options['save_dir']}{oneMap}_iteration_{iteration_id}"
+    save_score_matrix_figure(_worker['fig'], filename, options['hide_zeros'])
+    return filename
+
+def render_in_parallel(iterations, save_dir, hide_zeros, constant_color, colormap_name, jobs):
+    """Shard (iteration, map) figures across a process pool.
 
+    Every map is decoded once into stacked arrays, one per matrix shape it has,
+    and written to temporary .npy files, which the workers memory-map instead of
+    receiving matrices by pickle.  Maps are taken from all iterations, not just
+    the first.  Jobs are submitted and collected in the same iteration/map order
+    as the serial renderer, and output filenames are unchanged.
+    """
+    map_names = plotUtil.score_matrix_map_names(iterations)
+    options = {
+        'save_dir': save_dir,
+        'hide_zeros': hide_zeros,
+        'constant_color': constant_color,
+        'colormap_name': colormap_name
+    }
+    with tempfile.TemporaryDirectory(prefix='scoreMatrixHeatMap_') as stack_dir:
+        stack_paths = {}
+        # (iteration index, map) -> (stack, index within the stack)
+        stack_positions = {}
+        for map_index, oneMap in enumerate(map_names):
+            shape_groups = {}
+            for iteration_index, iteration in enumerate(iterations):
+                maps = plotUtil.score_matrix_maps(iteration['scoreMatrix'])
+                if oneMap in maps:
+                    shape_groups.setdefault(np.shape(maps[oneMap]), []).append(iteration_index)
+            for shape_index, iteration_indices in enumerate(shape_groups.values()):
+                stack_key = f"map_{map_index}_{shape_index}"
+                _, stack = plotUtil.stack_score_matrices([iterations[i] for i in iteration_indices], oneMap, fill_value=0)
+                stack_paths[stack_key] = os.path.join(stack_dir, f"{stack_key}.npy")
+                np.save(stack_paths[stack_key], stack)
+                del stack
+                for position, iteration_index in enumerate(iteration_indices):
+                    stack_positions[(iteration_index, oneMap)] = (stack_key, position)
+
+        render_jobs = [
+            (*stack_positions[(iteration_index, oneMap)], iteration['id'], oneMap, iteration_coverage(iteration, oneMap))
+            for iteration_index, iteration in enumerate(iterations)
+            for oneMap in map_names
+            if (iteration_index, oneMap) in stack_positions
+        ]
+        print(f'Rendering {len(render_jobs)} figures with {jobs} worker processes')
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_render_worker,
+                                 initargs=(stack_paths, options)) as executor:
+            chunksize = max(1, len(render_jobs) // (jobs * 4))
+            for filename in executor.map(_render_job, render_jobs, chunksize=chunksize):
+                print('Saved ' + filename + '.pdf')
+
+TIMELINE_FORMATS = ('pdf', 'mp4', 'npz')
+
+def setup_timeline_figure(fig, first_matrix, oneMap, hide_zeros, constant_color, colormap_name):
+    """Build the heatmap artists once and return a function that updates them in place for one frame."""
+    fig.clf()
+    ax = fig.add_subplot()
+
+    if constant_color:
+        ax.imshow(np.ones_like(first_matrix), cmap='gray', interpolation='nearest', aspect='auto')
+        ax.invert_yaxis()
+        occupancy = plotUtil.render_occupancy_map(ax, first_matrix, constant_color, marker_size=10)
+        def update_matrix(matrix):
+            plotUtil.update_occupancy_map(occupancy, matrix, constant_color)
+    else:
+        cmap = AVAILABLE_COLORMAPS[colormap_name]
         if hide_zeros:
-            plt.savefig(filename + '.pdf', transparent=True, bbox_inches='tight')
+            ax.imshow(np.zeros_like(first_matrix), cmap='gray', alpha=0)
+            im = ax.imshow(np.ma.masked_where(first_matrix == 0, first_matrix), cmap=cmap,
+                           interpolation='nearest', aspect='auto', vmin=0, vmax=1)
+            def update_matrix(matrix):
+                im.set_data(np.ma.masked_where(matrix == 0, matrix))
         else:
-            plt.savefig(filename + '.pdf')
+            im = ax.imshow(first_matrix, cmap=cmap, interpolation='nearest', aspect='auto', vmin=0, vmax=1)
+            def update_matrix(matrix):
+                im.set_data(matrix)
+        ax.invert_yaxis()
+        fig.colorbar(im, ax=ax, label='Score')
+
+    ax.set_xlabel('spectral slope')
+    ax.set_ylabel('spectral rolloff')
+    title = ax.set_title('')
+    title_oneMap = oneMap.replace("refSingleEmb_mfcc-sans0-statistics_", "").replace("_retrainIncr50_zScoreNSynthTrain", "")
+
+    def update(matrix, iteration_id, coverage):
+        update_matrix(matrix)
+        if coverage is not None:
+            title.set_text(f"{title_oneMap}\nCoverage: {coverage}%")
+        else:
+            title.set_text(f"{title_oneMap}\nIteration {iteration_id}")
+
+    return update
+
+def render_timeline(iterations, save_dir, hide_zeros, constant_color, colormap_name, timeline_format, fps):
+    """Write all iterations of each map into one container instead of one PDF per iteration.
+
+    'pdf' writes a multi-page PDF, 'mp4' encodes a video with ffmpeg (which must
+    be on the PATH, e.g. from HPC/ffmpeg-runner.def) and 'npz' stores the decoded
+    (iterations, rows, cols) stack together with the iteration ids.  Maps are
+    taken from all iterations, and each map's timeline covers the iterations
+    that have it; a map whose matrix shape changes cannot be stacked, so raises
+    ValueError.
+    """
+    map_names = plotUtil.score_matrix_map_names(iterations)
+    fig = plt.figure(figsize=FIGURE_SIZE)
+    for oneMap in map_names:
+        map_iterations = plotUtil.iterations_with_map(iterations, oneMap)
+        iteration_ids, stack = plotUtil.stack_score_matrices(map_iterations, oneMap, fill_value=0)
+        coverages = [iteration_coverage(iteration, oneMap) for iteration in map_iterations]
+        filename = f"{save_dir}{oneMap}_timeline.{timeline_format}"
+        print(f'Writing {len(iteration_ids)} iterations of {oneMap} to {filename}')
+
+        if timeline_format == 'npz':
+            np.savez_compressed(filename, iteration_ids=np.array(iteration_ids), scoreMatrix=stack)
+            continue
+
+        update = setup_timeline_figure(fig, stack[0], oneMap, hide_zeros, constant_color, colormap_name)
+        if timeline_format == 'pdf':
+            savefig_kwargs = {'transparent': True, 'bbox_inches': 'tight'} if hide_zeros else {}
+            with PdfPages(filename) as pdf:
+                for matrix, iteration_id, coverage in zip(stack, iteration_ids, coverages):
+                    update(matrix, iteration_id, coverage)
+                    pdf.savefig(fig, **savefig_kwargs)
+        else:
+            writer = FFMpegWriter(fps=fps)
+            with writer.saving(fig, filename, dpi=fig.dpi):
+                for matrix, iteration_id, coverage in zip(stack, iteration_ids, coverages):
+                    update(matrix, iteration_id, coverage)
+                    writer.grab_frame()
+    plt.close(fig)
+
+def pop_option(argv, name, default=None):
+    """Remove "name value" from argv and return the value."""
+    if name not in argv:
+        return default
+    index = argv.index(name)
+    value = argv[index + 1]
+    del argv[index:index + 2]
+    return value
+
+def main():
+    # Optional flags are removed before reading the positional arguments:
+    #   --jobs N             render with N worker processes
+    #   --timeline pdf|mp4|npz  write one container per map instead of one PDF per iteration
+    #   --fps N              frame rate for --timeline mp4
+    argv = list(sys.argv)
+    jobs = int(pop_option(argv, '--jobs', 1))
+    timeline_format = pop_option(argv, '--timeline')
+    fps = int(pop_option(argv, '--fps', 10))
+    if timeline_format is not None and timeline_format not in TIMELINE_FORMATS:
+        print(f"Error: --timeline must be one of {', '.join(TIMELINE_FORMATS)}")
+        sys.exit(1)
+
+    json_file_path = argv[1]
+
+    if len(argv) > 3:
+         save_dir = argv[3]
+    else:
+         save_dir = './'
+
+    hide_zeros = True
+    constant_color = None
+    colormap_name = 'blue-yellow'  # default colormap
+
+    # Parse arguments
+    if len(argv) > 4:
+        arg = argv[4].lower()
+        if arg == 'true' or arg == 'false':
+            hide_zeros = (arg == 'true')
+        elif arg in AVAILABLE_COLORMAPS:
+            colormap_name = arg
+        else:
+            constant_color = argv[4]
+
+    if len(argv) > 5:
+        arg = argv[5].lower()
+        if arg in AVAILABLE_COLORMAPS:
+            colormap_name = arg
+
+    print(f'Hide zeros: {hide_zeros}')
+    print(f'Constant color: {constant_color}')
+    print(f'Using colormap: {colormap_name}')
+
+    data = plotUtil.read_columnar_data(json_file_path)
+    iterations = data['evoRuns'][0]['iterations']
+
+    if timeline_format:
+        render_timeline(iterations, save_dir, hide_zeros, constant_color, colormap_name, timeline_format, fps)
+    elif jobs > 1 and len(iterations) > 1:
+        render_in_parallel(iterations, save_dir, hide_zeros, constant_color, colormap_name, jobs)
+    else:
+        render_serially(iterations, save_dir, hide_zeros, constant_color, colormap_name)
 
-        plt.clf()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
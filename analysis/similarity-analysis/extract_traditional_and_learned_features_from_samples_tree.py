@@ -1,26 +1,62 @@
 import os
 import sys
+import shutil
 import numpy as np
 import librosa
-import tensorflow as tf
-import tensorflow_hub as hub
 from tqdm import tqdm
 from sklearn.preprocessing import StandardScaler
+from feature_store import FeatureStore, move_feature_store
+import queue
 import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-# Load VGGish model
-print("Loading VGGish model...")
-vggish_model = hub.load('https://tfhub.dev/google/vggish/1')
-print("VGGish model loaded successfully.")
-
-def extract_traditional_features(y, sr):
-    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13).mean(axis=1)
-    spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr).mean()
-    spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr).mean()
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr).mean(axis=1)
-    zero_crossing_rate = librosa.feature.zero_crossing_rate(y).mean()
-    rms = librosa.feature.rms(y=y).mean()
-    spectral_flatness = librosa.feature.spectral_flatness(y=y).mean()
+# Subdirectories of the output directory used by the streaming mode
+RAW_FEATURES_DIRNAME = 'raw_features'
+RAW_STAGING_DIRNAME = 'raw_features.tmp'
+NORMALIZED_STAGING_DIRNAME = 'normalized_features.tmp'
+EXTRACTION_MANIFEST_FILENAME = 'manifest.tsv'
+
+# Bump when the extracted features change, so existing raw features are re-extracted
+FEATURE_SCHEMA_VERSION = 2
+
+# tensorflow and the VGGish model are loaded on first use, not at import time,
+# so argument parsing and --help do not pay for them
+_vggish_model = None
+
+def get_vggish_model():
+    global _vggish_model
+    if _vggish_model is None:
+        import tensorflow_hub as hub
+        print("Loading VGGish model...")
+        _vggish_model = hub.load('https://tfhub.dev/google/vggish/1')
+        print("VGGish model loaded successfully.")
+    return _vggish_model
+
+VGGISH_SAMPLE_RATE = 16000
+VGGISH_WINDOW_SAMPLES = 16000
+# VGGish frames its input into 0.96 s examples (96 frames with a 160-sample hop)
+# that need 15600 samples each.  Windows from different files are laid out two
+# examples apart in one waveform, so every even example sees exactly one file's
+# window followed by silence, as when the file is run on its own.
+VGGISH_EXAMPLE_HOP_SAMPLES = 15360
+VGGISH_BATCH_STRIDE = 2 * VGGISH_EXAMPLE_HOP_SAMPLES
+
+def extract_traditional_features(y, sr, n_fft=2048, hop_length=512):
+    # One magnitude spectrogram, shared by every spectral descriptor, instead of
+    # each librosa.feature function computing its own STFT.  RMS, like the zero
+    # crossing rate, is computed from the signal, as its spectrogram form gives other values
+    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+    power = S ** 2
+    mel = librosa.feature.melspectrogram(S=power, sr=sr)
+    mfccs = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=13).mean(axis=1)
+    spectral_centroid = librosa.feature.spectral_centroid(S=S, sr=sr).mean()
+    spectral_rolloff = librosa.feature.spectral_rolloff(S=S, sr=sr).mean()
+    chroma = librosa.feature.chroma_stft(S=power, sr=sr).mean(axis=1)
+    zero_crossing_rate = librosa.feature.zero_crossing_rate(y, frame_length=n_fft, hop_length=hop_length).mean()
+    rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length).mean()
+    spectral_flatness = librosa.feature.spectral_flatness(S=S).mean()
     
     return np.concatenate([
         mfccs,
@@ -28,49 +64,168 @@ def extract_traditional_features(y, sr):
         chroma
     ])
 
-def extract_vggish_features(y, sr):
-    if sr != 16000:
-        y = librosa.resample(y=y, orig_sr=sr, target_sr=16000)
-    
+def vggish_input(y, sr):
+    """The first VGGish window of a signal: resampled to 16 kHz and padded or cut to 16000 samples."""
+    # Only resample what the window needs, plus a margin so the resampling
+    # filter's edge falls outside it
+    y = y[:int(np.ceil(VGGISH_WINDOW_SAMPLES * sr / VGGISH_SAMPLE_RATE)) + 1024]
+    if sr != VGGISH_SAMPLE_RATE:
+        y = librosa.resample(y=y, orig_sr=sr, target_sr=VGGISH_SAMPLE_RATE)
+
     # Ensure the audio is the correct length (0.96 seconds)
-    if len(y) < 16000:
-        y = np.pad(y, (0, 16000 - len(y)))
+    if len(y) < VGGISH_WINDOW_SAMPLES:
+        y = np.pad(y, (0, VGGISH_WINDOW_SAMPLES - len(y)))
     else:
-        y = y[:16000]
-    
+        y = y[:VGGISH_WINDOW_SAMPLES]
+    return y.astype(np.float32)
+
+def extract_vggish_features(y, sr):
+    import tensorflow as tf
+    y = vggish_input(y, sr)
+
     # Convert to tensorflow tensor and reshape to 1D
     y_tf = tf.convert_to_tensor(y, dtype=tf.float32)
     y_tf = tf.reshape(y_tf, [-1])  # Reshape to 1D
     
     # Extract VGGish embeddings
-    embeddings = vggish_model(y_tf)
+    embeddings = get_vggish_model()(y_tf)
     return embeddings.numpy().flatten()
 
+def embed_vggish_windows(windows):
+    """VGGish embeddings, one row per window, for a batch of vggish_input windows in one model call."""
+    import tensorflow as tf
+    waveform = np.zeros((len(windows), VGGISH_BATCH_STRIDE), dtype=np.float32)
+    waveform[:, :VGGISH_WINDOW_SAMPLES] = windows
+    embeddings = get_vggish_model()(tf.convert_to_tensor(waveform.reshape(-1)))
+    return embeddings.numpy()[::2][:len(windows)]
+
 def extract_combined_features(audio_file):
     y, sr = librosa.load(audio_file, sr=None)
     trad_features = extract_traditional_features(y, sr)
     vggish_features = extract_vggish_features(y, sr)
     return np.concatenate([trad_features, vggish_features])
 
-def process_directory(input_dir, output_dir, suffix_filter=None):
+def list_audio_files(input_dir, suffix_filter=None):
+    audio_files = []
+    for root, _, files in os.walk(input_dir):
+        for file in sorted(files):
+            if file.endswith(('.wav', '.mp3', '.ogg')):
+                if suffix_filter and not any(file.endswith(suffix) for suffix in suffix_filter):
+                    continue
+                audio_files.append(os.path.join(root, file))
+    return audio_files
+
+def decode_and_extract(audio_file):
+    """Worker job: decode a file and compute its traditional features and VGGish input window.
+
+    Returns (audio_file, (traditional_features, vggish_window), None), or
+    (audio_file, None, error message) if the file could not be processed.
+    """
+    try:
+        y, sr = librosa.load(audio_file, sr=None)
+        return audio_file, (extract_traditional_features(y, sr), vggish_input(y, sr)), None
+    except Exception as e:
+        return audio_file, None, f"{type(e).__name__}: {e}"
+
+def iter_decoded_features(audio_files, workers=1, in_flight_per_worker=16):
+    """Results of decode_and_extract for each file, in order, from a pool of worker processes.
+
+    VGGish inference stays in the calling process, so tensorflow is loaded once
+    rather than in every worker.
+    """
+    if workers <= 1:
+        yield from map(decode_and_extract, audio_files)
+        return
+    # Bound the number of files in flight, so results do not pile up in memory
+    # when the consumer is slower than the decoders
+    max_in_flight = workers * in_flight_per_worker
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for audio_file in audio_files:
+            in_flight.append(executor.submit(decode_and_extract, audio_file))
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def iter_combined_features(audio_files, workers=1, batch_size=64, queue_size=None):
+    """(audio_file, combined features, error) for each file, with VGGish run in batches.
+
+    A producer thread drives the decoding workers and fills a bounded queue,
+    while this generator accumulates batch_size VGGish windows per model call,
+    so decoding carries on during inference.  Errors are yielded as they occur,
+    so results are not strictly in file order.
+    """
+    decoded = queue.Queue(maxsize=queue_size or 2 * batch_size)
+    done = object()
+
+    def produce():
+        try:
+            for item in iter_decoded_features(audio_files, workers):
+                decoded.put(item)
+        except BaseException as e:
+            decoded.put(e)
+        decoded.put(done)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    batch = []
+    def flush():
+        paths, trad_features, windows = zip(*batch)
+        batch.clear()
+        try:
+            embeddings = embed_vggish_windows(np.stack(windows))
+        except Exception as e:
+            return [(path, None, f"{type(e).__name__}: {e}") for path in paths]
+        return [(path, np.concatenate([trad, embedding]), None)
+                for path, trad, embedding in zip(paths, trad_features, embeddings)]
+
+    while True:
+        item = decoded.get()
+        if item is done:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        input_path, result, error = item
+        if error is not None:
+            yield input_path, None, error
+            continue
+        batch.append((input_path, *result))
+        if len(batch) >= batch_size:
+            yield from flush()
+    if batch:
+        yield from flush()
+    producer.join()
+
+def report_errors(errors, total, max_listed=20):
+    if not errors:
+        return
+    print(f"{len(errors)} of {total} files could not be processed:")
+    for input_path, error in errors[:max_listed]:
+        print(f"  {input_path}: {error}")
+    if len(errors) > max_listed:
+        print(f"  ... and {len(errors) - max_listed} more")
+
+def process_directory(input_dir, output_dir, suffix_filter=None, workers=1, vggish_batch_size=64,
+                      output_format='npy', store_chunk_size=10000):
     all_features = []
     file_paths = []
+    errors = []
 
     print(f"Starting to process files in {input_dir}")
+    audio_files = list_audio_files(input_dir, suffix_filter)
     # First pass: extract features
-    for root, _, files in os.walk(input_dir):
-        for file in tqdm(files, desc=f"Extracting features from {root}"):
-            if file.endswith(('.wav', '.mp3', '.ogg')):
-                if suffix_filter and not any(file.endswith(suffix) for suffix in suffix_filter):
-                    continue
-                input_path = os.path.join(root, file)
-                try:
-                    print(f"Processing file: {input_path}")
-                    features = extract_combined_features(input_path)
-                    all_features.append(features)
-                    file_paths.append(input_path)
-                except Exception as e:
-                    print(f"Error processing {input_path}: {str(e)}")
+    progress = tqdm(iter_combined_features(audio_files, workers, vggish_batch_size),
+                    total=len(audio_files), desc="Extracting features")
+    for input_path, features, error in progress:
+        if error is None:
+            all_features.append(features)
+            file_paths.append(input_path)
+        else:
+            errors.append((input_path, error))
+            progress.set_postfix(errors=len(errors))
+    report_errors(errors, len(audio_files))
 
     if not all_features:
         print("No features were extracted. Check if the input directory contains supported audio files.")
@@ -81,14 +236,180 @@ def process_directory(input_dir, output_dir, suffix_filter=None):
     scaler = StandardScaler()
     normalized_features = scaler.fit_transform(all_features)
 
-    print("Normalization completed. Saving normalized features...")
-    # Second pass: save normalized features
-    for features, input_path in tqdm(zip(normalized_features, file_paths), desc="Saving normalized features", total=len(file_paths)):
+    if output_format == 'store':
+        print("Normalization completed. Saving normalized features to a feature store...")
+        store = FeatureStore(output_dir)
+        if store.count:
+            raise ValueError(f"{output_dir} already contains a feature store with {store.count} vectors")
+        relative_paths = [os.path.relpath(input_path, input_dir) for input_path in file_paths]
+        for start in tqdm(range(0, len(file_paths), store_chunk_size), desc="Saving normalized features"):
+            store.append(normalized_features[start:start + store_chunk_size], relative_paths[start:start + store_chunk_size])
+        store.update_meta(source_directory=os.path.abspath(input_dir))
+    else:
+        print("Normalization completed. Saving normalized features...")
+        save_npy_tree(normalized_features, file_paths, input_dir, output_dir)
+
+    # Save the scaler for future use
+    scaler_path = os.path.join(output_dir, 'feature_scaler.pkl')
+    from joblib import dump
+    dump(scaler, scaler_path)
+    print(f"Scaler saved to {scaler_path}")
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def load_extraction_manifest(manifest_path):
+    """Latest manifest entry per file: {relative path: (size, mtime_ns, schema version, raw store row)}."""
+    entries = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                # Skips a final line torn by a crash while it was being written
+                if not line.endswith('\n') or len(fields) != 5:
+                    continue
+                path, size, mtime_ns, schema_version, row = fields
+                entries[path] = (int(size), int(mtime_ns), int(schema_version), int(row))
+    return entries
+
+def append_extraction_manifest(manifest_path, entries):
+    """Append (relative path, size, mtime_ns, schema version, row) entries and sync them to disk."""
+    with open(manifest_path, 'a') as f:
+        for entry in entries:
+            f.write('\t'.join(str(field) for field in entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def compact_raw_store(raw_store, manifest_path, rows, relative_paths, signatures, output_dir, chunk_size=10000):
+    """Rewrite the raw store with only rows, in that order, dropping superseded rows and those of removed files.
+
+    rows[i] is the current row of relative_paths[i].  The manifest is removed
+    before the store is swapped and written again afterwards, so if this is
+    interrupted, the next run finds no manifest and extracts everything again
+    instead of using row numbers that no longer match.  Returns the new store.
+    """
+    raw_features = raw_store.features()
+    _, labels = raw_store.index()
+    rows = np.asarray(rows, dtype=np.int64)
+    staging_path = os.path.join(output_dir, RAW_STAGING_DIRNAME)
+    shutil.rmtree(staging_path, ignore_errors=True)
+    staging_store = FeatureStore(staging_path)
+    for start in range(0, len(rows), chunk_size):
+        end = start + chunk_size
+        staging_store.append(raw_features[rows[start:end]], relative_paths[start:end],
+                             [labels[row] for row in rows[start:end]])
+    staging_store.update_meta(**{key: value for key, value in raw_store.meta.items() if key not in staging_store.meta})
+    del raw_features
+
+    compacted_manifest_path = manifest_path + '.compacted'
+    if os.path.exists(compacted_manifest_path):
+        os.remove(compacted_manifest_path)
+    append_extraction_manifest(compacted_manifest_path, [
+        (path, *signatures[path], FEATURE_SCHEMA_VERSION, row) for row, path in enumerate(relative_paths)
+    ])
+    os.remove(manifest_path)
+    move_feature_store(staging_path, raw_store.path)
+    os.replace(compacted_manifest_path, manifest_path)
+    return FeatureStore(raw_store.path)
+
+def process_directory_streaming(input_dir, output_dir, suffix_filter=None, workers=1, vggish_batch_size=64,
+                                output_format='npy', store_chunk_size=10000, commit_size=256):
+    """Extract features into a raw feature store as they are computed, then normalise in a second pass.
+
+    Raw features are committed to output_dir/raw_features every commit_size
+    files while the scaler's mean and variance are accumulated with partial_fit,
+    so memory does not grow with the dataset.
+
+    Extraction is resumable: a manifest next to the raw store records each
+    file's size, mtime and feature schema version with its row, and is appended
+    to after each batch of rows is committed.  Files whose entry is up to date
+    are not extracted again; new and changed files get new rows, and the
+    manifest's latest entry for a file decides which row is used.  Before
+    normalising, the raw store is compacted if it holds rows that are no longer
+    current (superseded by a re-extraction, or of files removed from the tree),
+    so it does not grow across resumes.
+    """
+    raw_store_path = os.path.join(output_dir, RAW_FEATURES_DIRNAME)
+    raw_store = FeatureStore(raw_store_path)
+    if len(raw_store) and raw_store.meta.get('schema_version') != FEATURE_SCHEMA_VERSION:
+        print(f"Raw features in {raw_store_path} have another feature schema version; extracting everything again")
+        shutil.rmtree(raw_store_path)
+        raw_store = FeatureStore(raw_store_path)
+    raw_store.update_meta(schema_version=FEATURE_SCHEMA_VERSION)
+    manifest_path = os.path.join(raw_store_path, EXTRACTION_MANIFEST_FILENAME)
+    manifest = load_extraction_manifest(manifest_path)
+
+    print(f"Starting to process files in {input_dir}")
+    relative_paths = []
+    signatures = {}
+    current_rows = {}
+    audio_files = []
+    for input_path in list_audio_files(input_dir, suffix_filter):
         relative_path = os.path.relpath(input_path, input_dir)
-        output_path = os.path.join(output_dir, os.path.splitext(relative_path)[0] + '.npy')
+        relative_paths.append(relative_path)
+        signatures[relative_path] = file_signature(input_path)
+        entry = manifest.get(relative_path)
+        if entry is not None and entry[:3] == (*signatures[relative_path], FEATURE_SCHEMA_VERSION) and entry[3] < len(raw_store):
+            current_rows[relative_path] = entry[3]
+        else:
+            audio_files.append(input_path)
+    print(f"{len(current_rows)} files are up to date, {len(audio_files)} are new or changed")
 
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        np.save(output_path, features)
+    scaler = StandardScaler()
+    # Statistics for the up-to-date rows from earlier runs
+    raw_features = raw_store.features()
+    rows = np.sort(np.fromiter(current_rows.values(), dtype=np.int64, count=len(current_rows)))
+    for start in range(0, len(rows), store_chunk_size):
+        scaler.partial_fit(raw_features[rows[start:start + store_chunk_size]])
+
+    errors = []
+    pending_features = []
+    pending_paths = []
+    def commit():
+        batch = np.stack(pending_features).astype(np.float32)
+        first_row = len(raw_store)
+        raw_store.append(batch, pending_paths)
+        append_extraction_manifest(manifest_path, [
+            (path, *signatures[path], FEATURE_SCHEMA_VERSION, first_row + i) for i, path in enumerate(pending_paths)
+        ])
+        for i, path in enumerate(pending_paths):
+            current_rows[path] = first_row + i
+        scaler.partial_fit(batch)
+        pending_features.clear()
+        pending_paths.clear()
+
+    progress = tqdm(iter_combined_features(audio_files, workers, vggish_batch_size),
+                    total=len(audio_files), desc="Extracting features")
+    for input_path, features, error in progress:
+        if error is None:
+            pending_features.append(features)
+            pending_paths.append(os.path.relpath(input_path, input_dir))
+            if len(pending_features) >= commit_size:
+                commit()
+        else:
+            errors.append((input_path, error))
+            progress.set_postfix(errors=len(errors))
+    if pending_features:
+        commit()
+    report_errors(errors, len(audio_files))
+
+    if not current_rows:
+        print("No features were extracted. Check if the input directory contains supported audio files.")
+        return
+    raw_store.update_meta(source_directory=os.path.abspath(input_dir))
+
+    # Only the current row of each file still in the tree, in file order
+    current_paths = [path for path in relative_paths if path in current_rows]
+    rows = [current_rows[path] for path in current_paths]
+    if len(raw_store) > len(rows):
+        print(f"Compacting raw features: dropping {len(raw_store) - len(rows)} superseded rows")
+        raw_store = compact_raw_store(raw_store, manifest_path, rows, current_paths, signatures,
+                                      output_dir, store_chunk_size)
+        rows = None
+
+    print("Feature extraction completed. Saving normalized features...")
+    save_normalized_features(raw_store, scaler, input_dir, output_dir, output_format, store_chunk_size, rows)
 
     # Save the scaler for future use
     scaler_path = os.path.join(output_dir, 'feature_scaler.pkl')
@@ -96,11 +417,52 @@ def process_directory(input_dir, output_dir, suffix_filter=None):
     dump(scaler, scaler_path)
     print(f"Scaler saved to {scaler_path}")
 
+def save_normalized_features(raw_store, scaler, input_dir, output_dir, output_format='npy', chunk_size=10000, rows=None):
+    """Normalise rows (default: all) of the raw store in memory-mapped chunks, writing a feature store or a .npy tree."""
+    raw_features = raw_store.features()
+    paths, labels = raw_store.index()
+    if rows is None:
+        rows = range(len(raw_store))
+    rows = np.asarray(rows, dtype=np.int64)
+    paths = [paths[row] for row in rows]
+    labels = [labels[row] for row in rows]
+    chunks = tqdm(range(0, len(rows), chunk_size), desc="Saving normalized features")
+    if output_format == 'store':
+        # Built next to the output and swapped in, so an existing store stays valid until it is complete
+        staging_path = os.path.join(output_dir, NORMALIZED_STAGING_DIRNAME)
+        shutil.rmtree(staging_path, ignore_errors=True)
+        store = FeatureStore(staging_path)
+        for start in chunks:
+            end = start + chunk_size
+            store.append(scaler.transform(raw_features[rows[start:end]]), paths[start:end], labels[start:end])
+        store.update_meta(source_directory=os.path.abspath(input_dir))
+        move_feature_store(staging_path, output_dir)
+    else:
+        for start in chunks:
+            end = start + chunk_size
+            save_npy_tree(scaler.transform(raw_features[rows[start:end]]),
+                          [os.path.join(input_dir, path) for path in paths[start:end]],
+                          input_dir, output_dir, show_progress=False)
+
+def save_npy_tree(normalized_features, file_paths, input_dir, output_dir, show_progress=True):
+    """One .npy file per audio file, mirroring the input directory tree."""
+    for features, input_path in tqdm(zip(normalized_features, file_paths), desc="Saving normalized features",
+                                     total=len(file_paths), disable=not show_progress):
+        relative_path = os.path.relpath(input_path, input_dir)
+        output_path = os.path.join(output_dir, os.path.splitext(relative_path)[0] + '.npy')
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        np.save(output_path, features)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract and normalize audio features.")
     parser.add_argument("input_directory", help="Directory containing input audio files")
     parser.add_argument("output_directory", help="Directory to save output feature files")
     parser.add_argument("--filter", help="Comma-separated list of file suffixes to process (e.g., '020.wav,030.wav')")
+    parser.add_argument("--vggish-batch-size", type=int, default=64, help="Number of files embedded per VGGish model call (default: 64)")
+    parser.add_argument("--output-format", choices=['npy', 'store'], default='npy', help="Save one .npy file per audio file, or a single feature store (see feature_store.py) in the output directory")
+    parser.add_argument("--streaming", action="store_true", help="Commit raw features to <output>/raw_features as they are extracted, accumulate the normalisation statistics online and normalise in a second pass; re-runs only extract new or changed files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes decoding audio and computing librosa features (default: number of CPUs)")
     
     args = parser.parse_args()
 
@@ -116,7 +478,9 @@ if __name__ == "__main__":
         print(f"Applying filter: {suffix_filter}")
 
     try:
-        process_directory(args.input_directory, args.output_directory, suffix_filter)
+        process = process_directory_streaming if args.streaming else process_directory
+        process(args.input_directory, args.output_directory, suffix_filter, args.workers, args.vggish_batch_size,
+                args.output_format)
         print("Feature extraction and normalization complete!")
     except Exception as e:
         print(f"An error occurred during execution: {str(e)}")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Consolidated storage for per-sample feature vectors.
+
+A feature store is a directory holding one float32 matrix, one row per sample,
+and an index of the sample paths and labels in the same order:
+
+    features.f32   raw row-major float32 rows, memory-mapped for reading
+    index.tsv      "path<TAB>label" per row
+    meta.json      {"version", "dim", "count", ...}; the commit point for appends
+
+Rows are appended to the end of features.f32 and index.tsv and only become part
+of the store once meta.json has been replaced with the new count, so a crash
+during an append leaves the previously committed rows intact.
+
+Convert a directory tree of per-sample .npy files into a store with:
+
+    python3 feature_store.py <npy feature directory> <store directory>
+"""
+import os
+import sys
+import json
+import numpy as np
+
+FEATURES_FILENAME = 'features.f32'
+INDEX_FILENAME = 'index.tsv'
+META_FILENAME = 'meta.json'
+FEATURE_STORE_VERSION = 1
+
+def label_from_path(path):
+    # Label from the file name (assuming format: instrument_type_xxx-yyy-zzz.wav)
+    return os.path.basename(path).split('_')[0]
+
+def is_feature_store(path):
+    return os.path.isfile(os.path.join(path, META_FILENAME)) and os.path.isfile(os.path.join(path, FEATURES_FILENAME))
+
+class FeatureStore:
+    def __init__(self, path):
+        """Open the store at path, creating an empty one if it does not exist."""
+        self.path = path
+        self.features_path = os.path.join(path, FEATURES_FILENAME)
+        self.index_path = os.path.join(path, INDEX_FILENAME)
+        self.meta_path = os.path.join(path, META_FILENAME)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta.get('version') != FEATURE_STORE_VERSION:
+                raise ValueError(f"Unsupported feature store version {self.meta.get('version')} in {path}")
+        else:
+            self.meta = {'version': FEATURE_STORE_VERSION, 'dim': None, 'count': 0}
+        self._index = None
+
+    @property
+    def count(self):
+        return self.meta['count']
+
+    @property
+    def dim(self):
+        return self.meta['dim']
+
+    def __len__(self):
+        return self.count
+
+    def _commit_meta(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    def _discard_uncommitted(self):
+        """Cut off rows left behind by an append that did not reach its commit."""
+        if os.path.exists(self.features_path):
+            committed_bytes = self.count * (self.dim or 0) * 4
+            if os.path.getsize(self.features_path) > committed_bytes:
+                with open(self.features_path, 'r+b') as f:
+                    f.truncate(committed_bytes)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r+') as f:
+                for _ in range(self.count):
+                    f.readline()
+                f.truncate(f.tell())
+
+    def append(self, features, paths, labels=None):
+        """Append rows of features with their sample paths (and labels, by default taken from the paths)."""
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        if len(features) != len(paths):
+            raise ValueError(f"Got {len(features)} feature rows for {len(paths)} paths")
+        if labels is None:
+            labels = [label_from_path(path) for path in paths]
+        if len(features) == 0:
+            return
+        if self.dim is None:
+            self.meta['dim'] = int(features.shape[1])
+        elif features.shape[1] != self.dim:
+            raise ValueError(f"Feature dimension {features.shape[1]} does not match the store's {self.dim}")
+
+        os.makedirs(self.path, exist_ok=True)
+        self._discard_uncommitted()
+        with open(self.features_path, 'ab') as f:
+            f.write(features.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, 'a') as f:
+            for path, label in zip(paths, labels):
+                f.write(f"{path}\t{label}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.meta['count'] += len(features)
+        self._commit_meta()
+        if self._index is not None:
+            self._index[0].extend(paths)
+            self._index[1].extend(labels)
+
+    def update_meta(self, **values):
+        """Record extra values, e.g. how the features were produced, in meta.json."""
+        self.meta.update(values)
+        self._commit_meta()
+
+    def features(self, mode='r'):
+        """The committed feature matrix as a (count, dim) float32 memmap."""
+        if self.count == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.features_path, dtype=np.float32, mode=mode, shape=(self.count, self.dim))
+
+    def index(self):
+        """(paths, labels) for the committed rows."""
+        if self._index is None:
+            paths, labels = [], []
+            if self.count:
+                with open(self.index_path) as f:
+                    for _, line in zip(range(self.count), f):
+                        path, label = line.rstrip('\n').split('\t')
+                        paths.append(path)
+                        labels.append(label)
+            self._index = (paths, labels)
+        return self._index
+
+    def load(self):
+        """features, labels and paths in the form returned by the load_features functions."""
+        paths, labels = self.index()
+        return self.features(), np.array(labels), list(paths)
+
+def load_feature_store(path):
+    return FeatureStore(path).load()
+
+def move_feature_store(src_path, dst_path):
+    """Replace the store at dst_path with the one at src_path, which is removed."""
+    os.makedirs(dst_path, exist_ok=True)
+    # Invalidate the old store first, so dst_path never looks like a mix of the two
+    dst_meta_path = os.path.join(dst_path, META_FILENAME)
+    if os.path.exists(dst_meta_path):
+        os.remove(dst_meta_path)
+    for filename in (FEATURES_FILENAME, INDEX_FILENAME, META_FILENAME):
+        os.replace(os.path.join(src_path, filename), os.path.join(dst_path, filename))
+    os.rmdir(src_path)
+
+def convert_npy_tree(feature_dir, store_path, chunk_size=10000):
+    """Append every .npy file under feature_dir to the store at store_path."""
+    store = FeatureStore(store_path)
+    features, paths = [], []
+    for root, dirs, files in os.walk(feature_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith('.npy'):
+                file_path = os.path.join(root, file)
+                features.append(np.load(file_path))
+                paths.append(os.path.relpath(file_path, feature_dir))
+                if len(features) >= chunk_size:
+                    store.append(np.stack(features), paths)
+                    features, paths = [], []
+    if features:
+        store.append(np.stack(features), paths)
+    return store
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python3 feature_store.py <npy feature directory> <store directory>")
+        sys.exit(1)
+    store = convert_npy_tree(sys.argv[1], sys.argv[2])
+    print(f"{store.count} feature vectors of dimension {store.dim} in {sys.argv[2]}")
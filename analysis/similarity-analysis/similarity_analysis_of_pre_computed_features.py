@@ -1,11 +1,22 @@
+import argparse
 import numpy as np
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances
 import os
 from sklearn.model_selection import train_test_split
 import matplotlib.pyplot as plt
+from feature_store import is_feature_store, load_feature_store
+
+# hnswlib is optional: without it, SimilarityIndex falls back to exact search
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
 
 def load_features(feature_dir):
+    # A consolidated feature store is memory-mapped instead of crawled
+    if is_feature_store(feature_dir):
+        return load_feature_store(feature_dir)
     features = []
     labels = []
     file_paths = []
@@ -23,84 +34,308 @@ def load_features(feature_dir):
     
     return np.array(features), np.array(labels), file_paths
 
-def similarity_search(query, database, metric='cosine', top_k=5):
+def pairwise_similarities(queries, database, metric='cosine'):
     if metric == 'cosine':
-        similarities = cosine_similarity(query.reshape(1, -1), database)
+        return cosine_similarity(queries, database)
     elif metric == 'euclidean':
-        distances = euclidean_distances(query.reshape(1, -1), database)
-        similarities = 1 / (1 + distances)  # Convert distance to similarity
+        distances = euclidean_distances(queries, database)
+        return 1 / (1 + distances)  # Convert distance to similarity
     else:
         raise ValueError("Unsupported metric")
-    
-    top_indices = np.argsort(similarities[0])[::-1][:top_k]
-    return top_indices, similarities[0][top_indices]
 
-def evaluate_dimensionality(features, labels, n_components_range, metric='cosine'):
-    X_train, X_test, y_train, y_test = train_test_split(features, labels, test_size=0.2, random_state=42)
-    
-    results = []
-    for n in n_components_range:
-        if n >= min(X_train.shape):
-            print(f"Skipping n_components={n} as it's >= min(n_samples, n_features)={min(X_train.shape)}")
-            continue
-        
-        pca = PCA(n_components=n)
-        X_train_reduced = pca.fit_transform(X_train)
-        X_test_reduced = pca.transform(X_test)
-        
-        correct_matches = 0
-        for i, test_sample in enumerate(X_test_reduced):
-            top_indices, _ = similarity_search(test_sample, X_train_reduced, metric=metric)
-            if y_train[top_indices[0]] == y_test[i]:
-                correct_matches += 1
-        
-        accuracy = correct_matches / len(y_test)
-        variance_ratio = sum(pca.explained_variance_ratio_[:n])
-        
-        results.append((n, accuracy, variance_ratio))
-        print(f"Components: {n}, Accuracy: {accuracy:.4f}, Variance Ratio: {variance_ratio:.4f}")
-    
+def top_k_indices(similarities, top_k):
+    """Column indices of the top_k largest values in each row, best first, without sorting whole rows."""
+    n_rows, n_columns = similarities.shape
+    top_k = min(top_k, n_columns)
+    if top_k < n_columns:
+        candidates = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(n_columns), (n_rows, n_columns))
+    order = np.argsort(-np.take_along_axis(similarities, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+def similarity_search_batch(queries, database, metric='cosine', top_k=5, block_size=1024):
+    """Exact top_k search for each row of queries, computed block_size queries at a time.
+
+    Returns (indices, similarities), each of shape (len(queries), top_k).
+    """
+    queries = np.atleast_2d(queries)
+    top_k = min(top_k, len(database))
+    indices = np.empty((len(queries), top_k), dtype=np.int64)
+    similarities = np.empty((len(queries), top_k))
+    for start in range(0, len(queries), block_size):
+        block_similarities = pairwise_similarities(queries[start:start + block_size], database, metric)
+        block_indices = top_k_indices(block_similarities, top_k)
+        indices[start:start + block_size] = block_indices
+        similarities[start:start + block_size] = np.take_along_axis(block_similarities, block_indices, axis=1)
+    return indices, similarities
+
+def similarity_search_chunked(queries, database, metric='cosine', top_k=5, chunk_size=10000):
+    """Exact top_k search like similarity_search_batch, reading database chunk_size rows at a time.
+
+    Only one chunk of the database is in memory at once, so it can be a
+    feature store memmap larger than memory.  Each chunk's top_k matches are
+    merged with the best found so far.
+    """
+    queries = np.atleast_2d(queries)
+    indices = np.empty((len(queries), 0), dtype=np.int64)
+    similarities = np.empty((len(queries), 0))
+    for start, end in iter_row_chunks(len(database), chunk_size):
+        chunk_indices, chunk_similarities = similarity_search_batch(queries, np.asarray(database[start:end]), metric, top_k)
+        indices = np.concatenate([indices, chunk_indices + start], axis=1)
+        similarities = np.concatenate([similarities, chunk_similarities], axis=1)
+        best = top_k_indices(similarities, top_k)
+        indices = np.take_along_axis(indices, best, axis=1)
+        similarities = np.take_along_axis(similarities, best, axis=1)
+    return indices, similarities
+
+def similarity_search(query, database, metric='cosine', top_k=5, chunk_size=None):
+    if chunk_size is None:
+        top_indices, similarities = similarity_search_batch(query.reshape(1, -1), database, metric, top_k)
+    else:
+        top_indices, similarities = similarity_search_chunked(query.reshape(1, -1), database, metric, top_k, chunk_size)
+    return top_indices[0], similarities[0]
+
+class SimilarityIndex:
+    """Nearest-neighbour index over a database of feature vectors, queried in batches.
+
+    Uses an HNSW graph from hnswlib when it is installed (approximate), and exact
+    blocked search otherwise or with exact=True.  Similarities are on the same
+    scale as similarity_search: cosine similarity, or 1 / (1 + distance).
+    """
+    SPACES = {'cosine': 'cosine', 'euclidean': 'l2'}
+
+    def __init__(self, database, metric='cosine', exact=False, M=16, ef_construction=200, ef=100, num_threads=-1):
+        if metric not in self.SPACES:
+            raise ValueError("Unsupported metric")
+        self.database = database
+        self.metric = metric
+        self.ef = ef
+        self.num_threads = num_threads
+        self.hnsw_index = None
+        if not exact and hnswlib is not None:
+            self.hnsw_index = hnswlib.Index(space=self.SPACES[metric], dim=database.shape[1])
+            self.hnsw_index.init_index(max_elements=len(database), ef_construction=ef_construction, M=M)
+            self.hnsw_index.add_items(np.asarray(database, dtype=np.float32), np.arange(len(database)), num_threads=num_threads)
+
+    def query(self, queries, top_k=5):
+        """(indices, similarities) of the top_k matches for each row of queries, best first."""
+        queries = np.atleast_2d(queries)
+        if self.hnsw_index is None:
+            return similarity_search_batch(queries, self.database, self.metric, top_k)
+        top_k = min(top_k, len(self.database))
+        self.hnsw_index.set_ef(max(self.ef, top_k))
+        indices, distances = self.hnsw_index.knn_query(np.asarray(queries, dtype=np.float32), k=top_k, num_threads=self.num_threads)
+        if self.metric == 'cosine':
+            similarities = 1 - distances
+        else:
+            # hnswlib's l2 space gives squared distances
+            similarities = 1 / (1 + np.sqrt(np.maximum(distances, 0)))
+        return indices.astype(np.int64), similarities
+
+def evaluate_dimensionality_batched(features, labels, n_components_range, metrics=('cosine', 'euclidean'),
+                                    pca_method='full', chunk_size=10000, max_block_bytes=256 * 2**20):
+    """1-NN accuracy for every n in n_components_range and every metric, from a single PCA fit.
+
+    The data is projected once onto the largest number of components, and each
+    truncation n uses the first n columns.  Test samples are processed in blocks
+    sized to max_block_bytes; for each block the test-train dot products are
+    accumulated one component range at a time, so every truncation and both
+    metrics are evaluated in one pass.  Returns {metric: [(n, accuracy,
+    variance_ratio), ...]}.
+
+    The train/test split is made on row indices and the PCA is fitted with
+    fit_pca's pca_method; with 'incremental', features are only read
+    chunk_size rows at a time, so only the projections are held in memory.
+    """
+    if any(metric not in ('cosine', 'euclidean') for metric in metrics):
+        raise ValueError("Unsupported metric")
+    # Sorted, so the chunks read from a memmap are close together on disk
+    train_rows, test_rows = train_test_split(np.arange(len(features)), test_size=0.2, random_state=42)
+    train_rows, test_rows = np.sort(train_rows), np.sort(test_rows)
+    y_train, y_test = labels[train_rows], labels[test_rows]
+
+    n_values = []
+    max_components = min(len(train_rows), features.shape[1])
+    for n in sorted(set(n_components_range)):
+        if n >= max_components:
+            print(f"Skipping n_components={n} as it's >= min(n_samples, n_features)={max_components}")
+        else:
+            n_values.append(n)
+    if not n_values:
+        return {metric: [] for metric in metrics}
+
+    pca = fit_pca(features, n_values[-1], pca_method, chunk_size, rows=train_rows)
+    X_train_reduced = transform_in_chunks(pca, features, chunk_size, rows=train_rows)
+    X_test_reduced = transform_in_chunks(pca, features, chunk_size, rows=test_rows)
+    variance_ratios = np.cumsum(pca.explained_variance_ratio_)
+
+    # Squared norms of the training vectors for each truncation, shape (n_train, len(n_values))
+    train_norms_squared = np.cumsum(X_train_reduced ** 2, axis=1)[:, np.array(n_values) - 1]
+
+    correct_matches = {metric: np.zeros(len(n_values), dtype=np.int64) for metric in metrics}
+    # The dot products and one temporary of the same size per block
+    block_size = max(1, max_block_bytes // (2 * X_train_reduced.itemsize * len(X_train_reduced)))
+    for start in range(0, len(X_test_reduced), block_size):
+        test_block = X_test_reduced[start:start + block_size]
+        y_block = y_test[start:start + block_size]
+        dot_products = np.zeros((len(test_block), len(X_train_reduced)), dtype=X_train_reduced.dtype)
+        previous_n = 0
+        for i, n in enumerate(n_values):
+            dot_products += test_block[:, previous_n:n] @ X_train_reduced[:, previous_n:n].T
+            previous_n = n
+            # Terms that only depend on the test sample do not change its nearest neighbour
+            if 'cosine' in metrics:
+                train_norms = np.maximum(np.sqrt(train_norms_squared[:, i]), np.finfo(dot_products.dtype).tiny)
+                nearest = np.argmax(dot_products / train_norms, axis=1)
+                correct_matches['cosine'][i] += np.sum(y_train[nearest] == y_block)
+            if 'euclidean' in metrics:
+                nearest = np.argmin(train_norms_squared[:, i] - 2 * dot_products, axis=1)
+                correct_matches['euclidean'][i] += np.sum(y_train[nearest] == y_block)
+
+    results = {}
+    for metric in metrics:
+        results[metric] = []
+        for i, n in enumerate(n_values):
+            accuracy = correct_matches[metric][i] / len(y_test)
+            results[metric].append((n, accuracy, variance_ratios[n - 1]))
+            print(f"Metric: {metric}, Components: {n}, Accuracy: {accuracy:.4f}, Variance Ratio: {variance_ratios[n - 1]:.4f}")
     return results
 
+def iter_row_chunks(n_rows, chunk_size, min_chunk_size=1):
+    """(start, end) row ranges of about chunk_size rows; a short final range is merged into the previous one."""
+    starts = list(range(0, n_rows, chunk_size))
+    if len(starts) > 1 and n_rows - starts[-1] < min_chunk_size:
+        starts.pop()
+    return [(start, end) for start, end in zip(starts, starts[1:] + [n_rows])]
+
+def read_rows(features, rows, start, end):
+    """Rows start:end of features, or of the subset rows of it if given."""
+    return features[start:end] if rows is None else features[rows[start:end]]
+
+def fit_pca(features, n_components=None, method='full', chunk_size=10000, rows=None):
+    """Fit a PCA of features (or of the subset rows of them) with method 'full', 'randomized' (leading components only) or 'incremental'.
+
+    'incremental' streams features, e.g. a feature store memmap, through
+    IncrementalPCA chunk_size rows at a time, so only one chunk is in memory.
+    """
+    if method in ('full', 'randomized'):
+        X = features if rows is None else features[rows]
+        svd_solver = 'auto' if method == 'full' else 'randomized'
+        return PCA(n_components=n_components, svd_solver=svd_solver, random_state=42).fit(X)
+    elif method == 'incremental':
+        n_rows = len(features) if rows is None else len(rows)
+        n_components = n_components or min(features.shape[1], chunk_size)
+        pca = IncrementalPCA(n_components=n_components)
+        # Every partial_fit needs at least n_components rows
+        for start, end in iter_row_chunks(n_rows, max(chunk_size, n_components), n_components):
+            pca.partial_fit(read_rows(features, rows, start, end))
+        return pca
+    else:
+        raise ValueError(f"Unsupported PCA method: {method}")
+
+def transform_in_chunks(pca, features, chunk_size=10000, rows=None):
+    n_rows = len(features) if rows is None else len(rows)
+    return np.concatenate([pca.transform(read_rows(features, rows, start, end))
+                           for start, end in iter_row_chunks(n_rows, chunk_size)])
+
+def feature_statistics(features, chunk_size=10000):
+    """Mean, standard deviation, minimum and maximum over all values of features, read chunk_size rows at a time."""
+    count, mean, m2 = 0, 0.0, 0.0
+    minimum, maximum = np.inf, -np.inf
+    for start, end in iter_row_chunks(len(features), chunk_size):
+        chunk = np.asarray(features[start:end], dtype=np.float64)
+        chunk_mean = chunk.mean()
+        # Chan et al.'s pairwise update of the mean and sum of squared deviations
+        delta = chunk_mean - mean
+        total = count + chunk.size
+        m2 += ((chunk - chunk_mean) ** 2).sum() + delta ** 2 * count * chunk.size / total
+        mean += delta * chunk.size / total
+        count = total
+        minimum = min(minimum, chunk.min())
+        maximum = max(maximum, chunk.max())
+    return mean, np.sqrt(m2 / count), minimum, maximum
+
+def explained_variance_curve(features, method='full', n_components=None, chunk_size=10000):
+    """Cumulative explained variance ratio for 1, 2, ... components.
+
+    With 'randomized' or 'incremental' only the leading n_components are computed
+    (default: 256 and min(n_features, chunk_size) respectively), but the ratios are
+    still relative to the total variance of the data.
+    """
+    if method == 'randomized' and n_components is None:
+        n_components = min(256, *features.shape)
+    pca = fit_pca(features, n_components, method, chunk_size)
+    return np.cumsum(pca.explained_variance_ratio_)
+
+def optimal_n_components(cumulative_variance_ratio, threshold=0.95):
+    """Smallest number of components explaining at least threshold of the variance."""
+    if cumulative_variance_ratio[-1] < threshold:
+        print(f"Warning: the {len(cumulative_variance_ratio)} computed components only explain "
+              f"{cumulative_variance_ratio[-1]:.4f} of the variance; using all of them")
+        return len(cumulative_variance_ratio)
+    return int(np.argmax(cumulative_variance_ratio >= threshold)) + 1
+
+parser = argparse.ArgumentParser(description="Similarity search and PCA dimensionality analysis of pre-computed audio features.")
+parser.add_argument("feature_dir", nargs='?', default="/Users/bjornpjo/Downloads/audio-features/nsynth-train_trad_and_learned_combined",
+                    help="Feature store or directory tree of .npy feature files")
+# 'full' PCA needs the whole feature matrix in memory; 'incremental' streams it
+# in chunks, for feature stores larger than memory, and 'randomized' only
+# computes the leading components
+parser.add_argument("--pca-method", choices=['full', 'randomized', 'incremental'], default='full',
+                    help="PCA method; 'incremental' reads a feature store in chunks and never loads it whole (default: full)")
+parser.add_argument("--chunk-size", type=int, default=10000, help="Feature rows read at a time (default: 10000)")
+parser.add_argument("--index", choices=['exact', 'hnsw'], default='exact',
+                    help="Search over the PCA-reduced features; 'hnsw' uses an approximate hnswlib index (default: exact)")
+args = parser.parse_args()
+pca_method = args.pca_method
+chunk_size = args.chunk_size
+if args.index == 'hnsw' and hnswlib is None:
+    print("hnswlib is not installed; using exact search over the PCA-reduced features")
+
 # Load features
-feature_dir = "/Users/bjornpjo/Downloads/audio-features/nsynth-train_trad_and_learned_combined"
-all_features, labels, file_paths = load_features(feature_dir)
+all_features, labels, file_paths = load_features(args.feature_dir)
 print(f"Loaded {len(all_features)} features, each with {all_features[0].shape[0]} dimensions")
 print(f"Unique labels: {np.unique(labels)}")
 
 # Print some statistics about the features
+feature_mean, feature_std, feature_min, feature_max = feature_statistics(all_features, chunk_size)
 print(f"Feature statistics:")
-print(f"  Mean: {np.mean(all_features):.4f}")
-print(f"  Std Dev: {np.std(all_features):.4f}")
-print(f"  Min: {np.min(all_features):.4f}")
-print(f"  Max: {np.max(all_features):.4f}")
+print(f"  Mean: {feature_mean:.4f}")
+print(f"  Std Dev: {feature_std:.4f}")
+print(f"  Min: {feature_min:.4f}")
+print(f"  Max: {feature_max:.4f}")
 
 # Choose a query (e.g., the first feature vector)
 query_index = 0
-query_features = all_features[query_index]
+query_features = np.asarray(all_features[query_index])
 
 # Similarity search without dimensionality reduction
 for metric in ['cosine', 'euclidean']:
-    top_indices, similarities = similarity_search(query_features, all_features, metric=metric)
+    top_indices, similarities = similarity_search(query_features, all_features, metric=metric, chunk_size=chunk_size)
     print(f"\nTop 5 similar instruments without dimensionality reduction ({metric}):")
     for idx, sim in zip(top_indices, similarities):
         print(f"{file_paths[idx]} (Label: {labels[idx]}): {sim:.4f}")
 
 # Determine optimal number of components
-pca = PCA().fit(all_features)
-cumulative_variance_ratio = np.cumsum(pca.explained_variance_ratio_)
-optimal_components = np.argmax(cumulative_variance_ratio >= 0.95) + 1
+cumulative_variance_ratio = explained_variance_curve(all_features, method=pca_method, chunk_size=chunk_size)
+optimal_components = optimal_n_components(cumulative_variance_ratio, 0.95)
+print(f"\nExplained variance curve ({pca_method} PCA):")
+for n in sorted(set([1, 2, 5, 10, 20, 50, 100, 200, 500, optimal_components])):
+    if n <= len(cumulative_variance_ratio):
+        print(f"  {n} components: {cumulative_variance_ratio[n - 1]:.4f}")
 print(f"\nOptimal number of components (95% variance explained): {optimal_components}")
 
 # PCA with optimal components
-pca_optimal = PCA(n_components=optimal_components)
-reduced_features = pca_optimal.fit_transform(all_features)
+pca_optimal = fit_pca(all_features, optimal_components, method=pca_method, chunk_size=chunk_size)
+reduced_features = transform_in_chunks(pca_optimal, all_features, chunk_size)
 reduced_query = pca_optimal.transform(query_features.reshape(1, -1))
 
 for metric in ['cosine', 'euclidean']:
-    top_indices_pca, similarities_pca = similarity_search(reduced_query, reduced_features, metric=metric)
+    index = SimilarityIndex(reduced_features, metric=metric, exact=args.index == 'exact')
+    top_indices_pca, similarities_pca = index.query(reduced_query)
     print(f"\nTop 5 similar instruments with PCA ({optimal_components} components, {metric}):")
-    for idx, sim in zip(top_indices_pca, similarities_pca):
+    for idx, sim in zip(top_indices_pca[0], similarities_pca[0]):
         print(f"{file_paths[idx]} (Label: {labels[idx]}): {sim:.4f}")
 
 # Evaluate dimensionality
@@ -108,8 +343,10 @@ max_components = min(all_features.shape[0], all_features.shape[1]) - 1
 n_components_range = sorted(set([10, 20, 30, 50, 70, 100, 150, 200, optimal_components]))
 n_components_range = [n for n in n_components_range if n < max_components]
 
-results_cosine = evaluate_dimensionality(all_features, labels, n_components_range, metric='cosine')
-results_euclidean = evaluate_dimensionality(all_features, labels, n_components_range, metric='euclidean')
+results = evaluate_dimensionality_batched(all_features, labels, n_components_range,
+                                          pca_method=pca_method, chunk_size=chunk_size)
+results_cosine = results['cosine']
+results_euclidean = results['euclidean']
 
 # Plot results
 plt.figure(figsize=(12, 6))
@@ -121,9 +358,19 @@ plt.title('Accuracy vs Number of PCA Components')
 plt.legend()
 plt.show()
 
+# Plot the explained variance curve
+plt.figure(figsize=(12, 6))
+plt.plot(np.arange(1, len(cumulative_variance_ratio) + 1), cumulative_variance_ratio)
+plt.axhline(0.95, color='gray', linestyle='--')
+plt.axvline(optimal_components, color='gray', linestyle=':')
+plt.xlabel('Number of Components')
+plt.ylabel('Cumulative Explained Variance Ratio')
+plt.title(f'Explained Variance Curve ({pca_method} PCA)')
+plt.show()
+
 # Plot explained variance ratio
 plt.figure(figsize=(12, 6))
-plt.plot(n_components_range, [r[2] for r in results_cosine])
+plt.plot([r[0] for r in results_cosine], [r[2] for r in results_cosine])
 plt.xlabel('Number of Components')
 plt.ylabel('Cumulative Explained Variance Ratio')
 plt.title('Explained Variance Ratio vs Number of PCA Components')
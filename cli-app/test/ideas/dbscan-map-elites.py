@@ -4,14 +4,21 @@ from sklearn.decomposition import PCA
 import hdbscan
 import hnswlib
 import os
+import sys
 from enum import Enum
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'analysis', 'similarity-analysis'))
+from feature_store import is_feature_store, load_feature_store
+
 class EliteSelectionStrategy(Enum):
     PARETO_DOMINANCE = 1
     WEIGHTED_SUM = 2
     PERFORMANCE_ONLY = 3
 
 def load_features(feature_dir):
+    # A consolidated feature store is memory-mapped instead of crawled
+    if is_feature_store(feature_dir):
+        return load_feature_store(feature_dir)
     features = []
     labels = []
     file_paths = []